@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
+import errno
+import functools
+import grp
 import importlib.util
+import json
 import os
+import pwd
 import re
 import shutil
 import site
+import stat
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
 import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable, Iterable, List, Optional
@@ -20,6 +31,39 @@ DEFAULT_FALLBACK_TMP_DIR = Path("/var/tmp")
 MIN_TMP_FREE_BYTES = 2 * 1024 * 1024 * 1024
 STALE_TMP_AGE_SECONDS = 24 * 60 * 60
 TMP_DIR_PREFIXES = ("foundry_download_", "foundry_extract_")
+DOWNLOAD_CACHE_NAME = ".fmd-cache.json"
+# Hidden work dir next to the modules dir, used when /tmp is on another device.
+SAME_FS_WORK_DIR_NAME = ".fmd-work"
+# Directory (inside a download temp dir) holding a tar extracted on the fly.
+STREAM_EXTRACT_DIR_NAME = ".extracted"
+# Mega links whose content cannot change, so a recorded install is enough to
+# skip; a folder link can gain or replace files behind the same URL.
+IMMUTABLE_MEGA_KINDS = ("file", "folder_file")
+DOWNLOAD_BUFFER_SIZE = 2 * 1024 * 1024
+# <title> sits in <head>; look at the first page first, then a bit further.
+HTML_TITLE_SCAN_CHARS = (8 * 1024, 64 * 1024)
+HTML_SNIFF_BYTES = 4 * 1024
+# Range resumes allowed in a row without new data before a download fails.
+DOWNLOAD_RESUME_ATTEMPTS = 5
+COPY_CHUNK_SIZE = 1024 * 1024 * 1024
+COPY_FILE_RANGE_UNSUPPORTED = (
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.EPERM,
+)
+MAX_PARALLEL_DOWNLOADS = 8
+MAX_CHOWN_WORKERS = 8
+MAX_ZIP_WORKERS = 8
+ZIP_PARALLEL_MIN_MEMBERS = 64
+HTTP_POOL_CONNECTIONS = 8
+HTTP_POOL_MAXSIZE = 32
+HTTP_RETRY_TOTAL = 5
+HTTP_RETRY_BACKOFF = 1.0
+HTTP_RETRY_JITTER = 1.0
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_RETRY_METHODS = ("GET", "HEAD")
 
 ARCHIVE_TAR_EXTS = (
     ".tar",
@@ -32,6 +76,11 @@ ARCHIVE_TAR_EXTS = (
     ".txz",
 )
 ARCHIVE_7Z_EXTS = (".7z", ".rar")
+ARCHIVE_KINDS = {
+    ".zip": "zip",
+    **{ext: "tar" for ext in ARCHIVE_TAR_EXTS},
+    **{ext: "7z" for ext in ARCHIVE_7Z_EXTS},
+}
 TELEGRAM_HOSTS = ("t.me", "telegram.me", "telegram.dog")
 YANDEX_HOSTS = ("disk.yandex.ru", "disk.yandex.com", "yadi.sk")
 YANDEX_DIRECT_HOSTS = (
@@ -39,6 +88,41 @@ YANDEX_DIRECT_HOSTS = (
     "downloader.disk.yandex.com",
     "storage.yandex.net",
 )
+URL_KIND_HOSTS = {
+    "gdrive": ("drive.google.com", "docs.google.com"),
+    "mega": ("mega.nz", "mega.co.nz"),
+    "dropbox": ("dropbox.com", "dropboxusercontent.com"),
+    "telegram": TELEGRAM_HOSTS,
+}
+
+# KEY=value per line; quotes are stripped, and " #" starts a trailing comment
+# on unquoted values.
+_DOTENV_RE = re.compile(
+    r"^[ \t]*(?:export[ \t]+)?([A-Za-z_][A-Za-z0-9_.-]*)[ \t]*=[ \t]*"
+    r"""(?:"([^"\r\n]*)"|'([^'\r\n]*)'|([^\r\n]*?))"""
+    r"[ \t]*(?:[ \t]#[^\r\n]*)?\r?$",
+    re.MULTILINE,
+)
+_GDRIVE_ID_RE = re.compile(r"/file/d/([a-zA-Z0-9_-]+)")
+_GDRIVE_UC_ID_RE = re.compile(r"/uc\?export=download&id=([a-zA-Z0-9_-]+)")
+# Every field download_google_drive needs from a Drive interstitial page, so
+# the page is scanned once. Alternatives are tried left to right at each
+# position, so the download form wins over the bare action attribute.
+_GDRIVE_HTML_RE = re.compile(
+    r'"downloadUrl"\s*:\s*"(?P<download_url>[^"]+)"'
+    r'|href="(?P<href>/uc\?export=download[^"]+)"'
+    r'|<form[^>]+id="download-form"[^>]+action="(?P<form_action>[^"]+)"'
+    r'|action="(?P<action>[^"]+)"'
+    r'|name="(?P<field>confirm|uuid|id|export)"\s+value="(?P<value>[^"]+)"'
+    r"|confirm=(?P<confirm_qs>[0-9A-Za-z_-]+)"
+    r"|'confirm'\s*:\s*'(?P<confirm_json>[^']+)'"
+)
+_CONFIRM_QS_RE = re.compile(r"confirm=([0-9A-Za-z_-]+)")
+_CD_FILENAME_RE = re.compile(r"filename\*=UTF-8''([^;]+)|filename=\"?([^\";]+)\"?")
+_HTML_TITLE_RE = re.compile(r"<title[^>]*>([^<]*)</title>", re.IGNORECASE)
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-\d+/(\d+|\*)", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+_UNSAFE_STEM_RE = re.compile(r"[^a-zA-Z0-9_-]+")
 
 
 @dataclass(frozen=True)
@@ -48,49 +132,131 @@ class TelegramConfig:
     session: str
 
 
+@dataclass
+class DownloadRecord:
+    previous: Optional[dict] = None
+    validator: Optional[List[Optional[str]]] = None
+    unchanged: bool = False
+
+
+# Keyed by whether the session retries; size probes must fail fast.
+_HTTP_SESSIONS: dict = {}
+_HTTP_SESSION_LOCK = threading.Lock()
+# Serializes installs into the modules dir so parallel URLs cannot race on
+# the same module name.
+_MODULES_DIR_LOCK = threading.Lock()
+# Telethon keeps its session in SQLite and may prompt for a login, so only
+# one client can be open at a time.
+_TELEGRAM_LOCK = threading.Lock()
+# Set on Ctrl-C. Pool threads are joined at exit, so running downloads
+# check it and stop instead of finishing and installing.
+_ABORT = threading.Event()
+
+
+def check_aborted() -> None:
+    if _ABORT.is_set():
+        raise RuntimeError("Interrupted.")
+
+
 def load_dotenv(path: Path, override: bool = False) -> bool:
-    if not path.is_file():
+    try:
+        text = path.read_text(encoding="utf-8")
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
         return False
 
-    for raw_line in path.read_text(encoding="utf-8").splitlines():
-        line = raw_line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if line.startswith("export "):
-            line = line[len("export ") :].lstrip()
-        if "=" not in line:
-            continue
-        key, value = line.split("=", 1)
-        key = key.strip()
-        if not key:
-            continue
-        value = value.strip()
-        if (value.startswith('"') and value.endswith('"')) or (
-            value.startswith("'") and value.endswith("'")
-        ):
-            value = value[1:-1]
+    for match in _DOTENV_RE.finditer(text):
+        key = match.group(1)
+        value = next(group for group in match.groups()[1:] if group is not None)
         if override or key not in os.environ:
             os.environ[key] = value
 
     return True
 
 
+def load_download_cache(modules_dir: Path) -> dict:
+    path = modules_dir / DOWNLOAD_CACHE_NAME
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        print(f"Warning: ignoring unreadable download cache {path} ({exc}).", file=sys.stderr)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_download_cache(modules_dir: Path, cache: dict) -> None:
+    path = modules_dir / DOWNLOAD_CACHE_NAME
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    # Workers still running after an interrupt may add entries meanwhile.
+    with _MODULES_DIR_LOCK:
+        payload = json.dumps(cache, indent=2, sort_keys=True)
+    tmp_path.write_text(payload, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def cached_paths_exist(entry: Optional[dict]) -> bool:
+    paths = entry.get("paths") if entry else None
+    return bool(paths) and all(Path(path).exists() for path in paths)
+
+
+def response_validator(response) -> Optional[List[Optional[str]]]:
+    tag = response.headers.get("etag") or response.headers.get("last-modified")
+    if not tag:
+        return None
+    return [tag, response.headers.get("content-length")]
+
+
+def is_unchanged_download(response, record: Optional[DownloadRecord]) -> bool:
+    if record is None:
+        return False
+    record.validator = response_validator(response)
+    previous = record.previous
+    if record.validator is None or not previous:
+        return False
+    if previous.get("validator") != record.validator or not cached_paths_exist(previous):
+        return False
+    record.unchanged = True
+    return True
+
+
 def run(
     cmd: List[str],
     ok_codes: Iterable[int] = (0,),
     stdout: Optional[int] = None,
     stderr: Optional[int] = None,
 ) -> None:
-    result = subprocess.run(cmd, stdout=stdout, stderr=stderr)
+    # With an absolute executable and close_fds=False CPython starts the child
+    # with posix_spawn instead of fork+exec. Our own descriptors are already
+    # non-inheritable (PEP 446), so nothing extra leaks into the child.
+    executable = cmd[0] if os.path.dirname(cmd[0]) else _which(cmd[0])
+    result = subprocess.run(
+        cmd,
+        executable=executable,
+        stdout=stdout,
+        stderr=stderr,
+        close_fds=False,
+    )
     if result.returncode not in ok_codes:
         raise subprocess.CalledProcessError(result.returncode, cmd)
 
 
-def ensure_module(module_name: str, pip_name: str) -> None:
-    if importlib.util.find_spec(module_name) is not None:
+# PATH and sys.path lookups walk the filesystem; results cannot change
+# during a run except through our own pip installs.
+_which = functools.lru_cache(maxsize=32)(shutil.which)
+
+
+@functools.lru_cache(maxsize=None)
+def _have_module(module_name: str) -> bool:
+    return importlib.util.find_spec(module_name) is not None
+
+
+def ensure_modules(modules: Iterable[tuple[str, str]]) -> None:
+    missing = [(module, pip_name) for module, pip_name in modules if not _have_module(module)]
+    if not missing:
         return
 
-    base_cmd = [sys.executable, "-m", "pip", "install", pip_name]
+    base_cmd = [sys.executable, "-m", "pip", "install", *(pip for _, pip in missing)]
     tried: List[List[str]] = []
 
     if site.ENABLE_USER_SITE:
@@ -102,21 +268,49 @@ def ensure_module(module_name: str, pip_name: str) -> None:
             pass
         else:
             importlib.invalidate_caches()
-            if importlib.util.find_spec(module_name) is not None:
+            _have_module.cache_clear()
+            if all(_have_module(module) for module, _ in missing):
                 return
 
     cmd = base_cmd + ["--break-system-packages"]
     tried.append(cmd)
     run(cmd)
     importlib.invalidate_caches()
-    if importlib.util.find_spec(module_name) is None:
+    _have_module.cache_clear()
+    failed = [module for module, _ in missing if not _have_module(module)]
+    if failed:
         joined = " | ".join(" ".join(c) for c in tried)
-        raise RuntimeError(f"Failed to install Python module '{module_name}'. Tried: {joined}")
+        raise RuntimeError(
+            f"Failed to install Python modules {', '.join(failed)}. Tried: {joined}"
+        )
+
+
+def required_modules(
+    urls: Iterable[str], progress: bool, telegram: Optional[TelegramConfig]
+) -> List[tuple[str, str]]:
+    urls = list(urls)
+    kinds = {classify_url(url) for url in urls}
+    required: List[tuple[str, str]] = []
+    if kinds & {"gdrive", "dropbox"} or any(
+        is_yandex_disk(url) or is_yandex_direct(url) for url in urls
+    ):
+        required.append(("requests", "requests"))
+    if progress:
+        required.append(("tqdm", "tqdm"))
+    if telegram is not None and "telegram" in kinds:
+        required.append(("telethon", "telethon"))
+    if (
+        "mega" in kinds
+        and not (_which("mega-get") or _which("megadl"))
+        and sys.version_info < (3, 13)
+    ):
+        required.append(("mega", "mega.py"))
+    return required
 
 
+@functools.lru_cache(maxsize=None)
 def get_tqdm() -> Optional[Callable[..., object]]:
     try:
-        ensure_module("tqdm", "tqdm")
         from tqdm import tqdm  # type: ignore
     except Exception as exc:
         print(f"Warning: tqdm unavailable ({exc}). Progress disabled.", file=sys.stderr)
@@ -124,6 +318,48 @@ def get_tqdm() -> Optional[Callable[..., object]]:
     return tqdm
 
 
+def build_retry(retry_cls, total: int):
+    options = dict(
+        total=total,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=HTTP_RETRY_METHODS,
+        respect_retry_after_header=True,
+        # Hand the last response back so raise_for_status reports it.
+        raise_on_status=False,
+    )
+    try:
+        # Jitter keeps parallel downloads from retrying in lockstep.
+        return retry_cls(**options, backoff_jitter=HTTP_RETRY_JITTER)
+    except TypeError:  # urllib3 < 2 has no backoff_jitter
+        pass
+    try:
+        return retry_cls(**options)
+    except TypeError:  # urllib3 < 1.26 names allowed_methods method_whitelist
+        options["method_whitelist"] = options.pop("allowed_methods")
+        return retry_cls(**options)
+
+
+def get_http_session(retry: bool = True):
+    with _HTTP_SESSION_LOCK:
+        session = _HTTP_SESSIONS.get(retry)
+        if session is None:
+            import requests  # type: ignore
+            from requests.adapters import HTTPAdapter  # type: ignore
+            from urllib3.util.retry import Retry  # type: ignore
+
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+                max_retries=build_retry(Retry, HTTP_RETRY_TOTAL if retry else 0),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _HTTP_SESSIONS[retry] = session
+    return session
+
+
 def format_bytes(value: int) -> str:
     size = float(value)
     units = ("B", "KB", "MB", "GB", "TB")
@@ -212,20 +448,60 @@ def select_work_dir(explicit: Optional[Path], expected_bytes: Optional[int]) ->
     return None
 
 
+def same_filesystem_work_dir(modules_dir: Path) -> Optional[Path]:
+    # Downloads land in the temp dir and are then moved into modules_dir; on
+    # the same device that move is a rename, otherwise every byte is copied.
+    default_tmp = tempfile.gettempdir()
+    try:
+        if os.stat(modules_dir).st_dev == os.stat(default_tmp).st_dev:
+            return None
+    except OSError:
+        return None
+
+    parent = modules_dir.resolve().parent
+    candidate = parent / SAME_FS_WORK_DIR_NAME
+    try:
+        # modules_dir may itself be a mount point (e.g. a Docker volume).
+        same_device = os.stat(parent).st_dev == os.stat(modules_dir).st_dev
+    except OSError:
+        same_device = False
+    if (
+        same_device
+        and os.access(parent, os.W_OK | os.X_OK)
+        and free_bytes(parent) >= MIN_TMP_FREE_BYTES
+    ):
+        try:
+            candidate.mkdir(mode=0o700, exist_ok=True)
+        except OSError:
+            pass
+        else:
+            print(
+                f"Temp dir {default_tmp} is on a different filesystem than {modules_dir}; "
+                f"downloading into {candidate} instead.",
+                file=sys.stderr,
+            )
+            return candidate
+
+    print(
+        f"Temp dir {default_tmp} is on a different filesystem than {modules_dir}; "
+        "modules will be copied across filesystems. "
+        "Use --work-dir to pick a directory on the same filesystem.",
+        file=sys.stderr,
+    )
+    return None
+
+
 def collect_temp_dirs(base_dir: Path) -> List[Path]:
-    if not base_dir.is_dir():
-        return []
     try:
-        entries = list(base_dir.iterdir())
-    except PermissionError:
+        with os.scandir(base_dir) as entries:
+            # Check the name first: is_dir() may need a stat, the name does not.
+            return [
+                Path(entry.path)
+                for entry in entries
+                if entry.name.startswith(TMP_DIR_PREFIXES) and entry.is_dir()
+            ]
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
         return []
-    found: List[Path] = []
-    for entry in entries:
-        if not entry.is_dir():
-            continue
-        if entry.name.startswith(TMP_DIR_PREFIXES):
-            found.append(entry)
-    return found
 
 
 def find_stale_temp_dirs(base_dirs: Iterable[Path], min_age_seconds: int) -> List[Path]:
@@ -253,6 +529,16 @@ def cleanup_temp_dirs(paths: Iterable[Path]) -> List[Path]:
     return removed
 
 
+def _first_entry(path: Path) -> Optional[os.DirEntry]:
+    with os.scandir(path) as entries:
+        return next(entries, None)
+
+
+def list_dir(path: Path) -> List[Path]:
+    with os.scandir(path) as entries:
+        return [Path(entry.path) for entry in entries]
+
+
 def summarize_paths(paths: List[Path], limit: int = 5) -> str:
     if not paths:
         return ""
@@ -262,33 +548,93 @@ def summarize_paths(paths: List[Path], limit: int = 5) -> str:
     return preview
 
 
+# Each URL is checked by several predicates and parsers; parse it once.
+_cached_urlparse = functools.lru_cache(maxsize=4096)(urlparse)
+
+
+def split_url(url: str) -> tuple[str, str, List[str], str]:
+    # A light urlparse for link parsers: (scheme, netloc, path parts, fragment).
+    scheme = ""
+    rest = url
+    sep = url.find("://")
+    if sep > 0 and url[:sep].isalpha():
+        scheme, rest = url[:sep].lower(), url[sep + 3 :]
+    rest, _, fragment = rest.partition("#")
+    rest = rest.partition("?")[0]
+    netloc = ""
+    if scheme:
+        netloc, _, rest = rest.partition("/")
+    parts = [part for part in rest.split("/") if part]
+    return scheme, netloc, parts, fragment
+
+
+def build_host_trie(kinds: dict) -> dict:
+    # Hosts are stored label by label from the TLD down, so a lookup walks at
+    # most len(labels) dict levels and stops at the first matching suffix.
+    trie: dict = {}
+    for kind, hosts in kinds.items():
+        for host in hosts:
+            labels = host.lower().split(".")[::-1]
+            node = trie
+            for label in labels[:-1]:
+                node = node.setdefault(label, {})
+            node[labels[-1]] = kind
+    return trie
+
+
+_HOST_TRIE = build_host_trie(URL_KIND_HOSTS)
+
+
+def lookup_host_kind(host: str) -> Optional[str]:
+    node = _HOST_TRIE
+    for label in reversed(host.split(".")):
+        node = node.get(label)
+        if node is None:
+            return None
+        if isinstance(node, str):
+            return node
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def classify_url(url: str) -> Optional[str]:
+    parsed = _cached_urlparse(url)
+    host = parsed.hostname
+    if host:
+        return lookup_host_kind(host)
+    if parsed.scheme:
+        return None
+
+    # Scheme-less Telegram links (t.me/channel/1) are accepted as-is.
+    host = parsed.path.lstrip("/").split("/", 1)[0].lower()
+    kind = lookup_host_kind(host) if host else None
+    return kind if kind == "telegram" else None
+
+
 def is_google_drive(url: str) -> bool:
-    host = urlparse(url).netloc.lower()
-    return host.endswith("drive.google.com") or host.endswith("docs.google.com")
+    return classify_url(url) == "gdrive"
 
 
 def is_mega(url: str) -> bool:
-    host = urlparse(url).netloc.lower()
-    return host.endswith("mega.nz") or host.endswith("mega.co.nz")
+    return classify_url(url) == "mega"
 
 
 def is_dropbox(url: str) -> bool:
-    host = urlparse(url).netloc.lower()
-    return host.endswith("dropbox.com") or host.endswith("dropboxusercontent.com")
+    return classify_url(url) == "dropbox"
 
 
 def is_yandex_disk(url: str) -> bool:
-    host = urlparse(url).netloc.lower()
+    host = _cached_urlparse(url).netloc.lower()
     return any(host == candidate or host.endswith(f".{candidate}") for candidate in YANDEX_HOSTS)
 
 
 def is_yandex_direct(url: str) -> bool:
-    host = urlparse(url).netloc.lower()
+    host = _cached_urlparse(url).netloc.lower()
     return any(host == candidate or host.endswith(f".{candidate}") for candidate in YANDEX_DIRECT_HOSTS)
 
 
 def parse_yandex_public_url(url: str) -> tuple[str, Optional[str]]:
-    parsed = urlparse(url)
+    parsed = _cached_urlparse(url)
     params = parse_qs(parsed.query)
     query_path = params.get("path", [None])[0]
     if query_path:
@@ -314,12 +660,11 @@ def parse_yandex_public_url(url: str) -> tuple[str, Optional[str]]:
 
 
 def yandex_expected_size(url: str) -> Optional[int]:
-    ensure_module("requests", "requests")
-    import requests  # type: ignore
-
+    # The size is only a hint for picking a temp dir; don't sit in backoff.
+    session = get_http_session(retry=False)
     if is_yandex_direct(url):
         try:
-            response = requests.head(url, allow_redirects=True, timeout=15)
+            response = session.head(url, allow_redirects=True, timeout=15)
             response.raise_for_status()
             length = response.headers.get("content-length")
             if length and length.isdigit():
@@ -332,7 +677,7 @@ def yandex_expected_size(url: str) -> Optional[int]:
     if public_path:
         params["path"] = public_path
     try:
-        response = requests.get(
+        response = session.get(
             "https://cloud-api.yandex.net/v1/disk/public/resources",
             params=params,
             timeout=15,
@@ -366,13 +711,14 @@ def telegram_expected_size(url: str, config: TelegramConfig) -> Optional[int]:
         return None
 
     try:
-        ensure_module("telethon", "telethon")
         from telethon.sync import TelegramClient  # type: ignore
     except Exception:
         return None
 
     try:
-        with TelegramClient(config.session, config.api_id, config.api_hash) as client:
+        with _TELEGRAM_LOCK, TelegramClient(
+            config.session, config.api_id, config.api_hash
+        ) as client:
             client.start()
             message = client.get_messages(info["peer"], ids=info["msg_id"])
             if not message or not message.file or not message.file.size:
@@ -394,36 +740,18 @@ def estimate_download_size(
     return None
 
 
-def normalize_telegram_url(url: str) -> str:
-    parsed = urlparse(url)
-    if parsed.scheme and parsed.netloc:
-        return url
-
-    path = parsed.path.lstrip("/")
-    for host in TELEGRAM_HOSTS:
-        if path.startswith(f"{host}/"):
-            return f"https://{path}"
-    return url
-
-
 def is_telegram(url: str) -> bool:
-    normalized = normalize_telegram_url(url)
-    host = urlparse(normalized).netloc.lower()
-    if host in TELEGRAM_HOSTS:
-        return True
-    return any(host.endswith(f".{candidate}") for candidate in TELEGRAM_HOSTS)
+    return classify_url(url) == "telegram"
 
 
 def parse_telegram_message_url(url: str) -> Optional[dict]:
-    normalized = normalize_telegram_url(url)
-    parsed = urlparse(normalized)
-    host = parsed.netloc.lower()
-    if host not in TELEGRAM_HOSTS and not any(
-        host.endswith(f".{candidate}") for candidate in TELEGRAM_HOSTS
-    ):
+    if not is_telegram(url):
         return None
 
-    parts = [part for part in parsed.path.split("/") if part]
+    scheme, _, parts, _ = split_url(url)
+    if not scheme:
+        # Scheme-less link (t.me/channel/1): the first part is the host.
+        parts = parts[1:]
     if not parts:
         return None
 
@@ -458,11 +786,8 @@ def parse_mega_link(url: str) -> Optional[dict]:
     if not is_mega(url):
         return None
 
-    parsed = urlparse(url)
-    parts = [part for part in parsed.path.split("/") if part]
-    fragment = parsed.fragment
-    scheme = parsed.scheme or "https"
-    base = f"{scheme}://{parsed.netloc}"
+    scheme, netloc, parts, fragment = split_url(url)
+    base = f"{scheme or 'https'}://{netloc}"
 
     if len(parts) >= 2 and parts[0].lower() == "file":
         return {
@@ -490,7 +815,8 @@ def parse_mega_link(url: str) -> Optional[dict]:
             "base": base,
         }
 
-    if fragment.startswith("F!"):
+    prefix = fragment[:2]
+    if prefix == "F!":
         tokens = fragment.split("!")
         if len(tokens) >= 3:
             info = {
@@ -504,7 +830,7 @@ def parse_mega_link(url: str) -> Optional[dict]:
                 info["file_id"] = tokens[3]
             return info
 
-    if fragment.startswith("!"):
+    if prefix[:1] == "!":
         tokens = fragment.split("!")
         if len(tokens) >= 3:
             return {
@@ -547,8 +873,8 @@ def normalize_dropbox_url(url: str) -> str:
     if not is_dropbox(url):
         return url
 
-    parsed = urlparse(url)
-    if parsed.netloc.lower().endswith("dropboxusercontent.com"):
+    parsed = _cached_urlparse(url)
+    if (parsed.hostname or "").endswith("dropboxusercontent.com"):
         return url
 
     params = parse_qs(parsed.query)
@@ -557,83 +883,194 @@ def normalize_dropbox_url(url: str) -> str:
 
 
 def extract_gdrive_file_id(url: str) -> Optional[str]:
-    parsed = urlparse(url)
+    parsed = _cached_urlparse(url)
     if parsed.query:
         params = parse_qs(parsed.query)
         if "id" in params and params["id"]:
             return params["id"][0]
-    match = re.search(r"/file/d/([a-zA-Z0-9_-]+)", parsed.path)
+    match = _GDRIVE_ID_RE.search(parsed.path)
     if match:
         return match.group(1)
-    match = re.search(r"/uc\?export=download&id=([a-zA-Z0-9_-]+)", url)
+    match = _GDRIVE_UC_ID_RE.search(url)
     if match:
         return match.group(1)
     return None
 
 
-def get_confirm_token_from_html(html: str) -> Optional[str]:
-    patterns = [
-        r"confirm=([0-9A-Za-z_-]+)",
-        r'name="confirm"\s+value="([^"]+)"',
-        r"'confirm'\s*:\s*'([^']+)'",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, html)
-        if match:
-            return match.group(1)
-    return None
+def unescape_json_string(value: str) -> str:
+    try:
+        return json.loads(f'"{value}"')
+    except ValueError:
+        # Cut short at an escaped quote; undo the escapes Drive actually uses.
+        return value.replace("\\u003d", "=").replace("\\u0026", "&").replace("\\/", "/")
 
 
-def extract_download_url_from_html(html: str) -> Optional[str]:
-    match = re.search(r'"downloadUrl"\s*:\s*"([^"]+)"', html)
-    if match:
-        url = match.group(1)
-        url = url.replace("\\u003d", "=").replace("\\u0026", "&").replace("\\/", "/")
-        return url
+def parse_gdrive_html(html: str) -> dict:
+    found: dict = {}
+    form_params: dict = {}
+    for match in _GDRIVE_HTML_RE.finditer(html):
+        kind = match.lastgroup
+        if kind == "value":
+            form_params.setdefault(match["field"], match["value"])
+            continue
+        value = match[kind]
+        found.setdefault(kind, value)
+        if kind == "form_action":
+            found.setdefault("action", value)
+        if kind in ("download_url", "href", "form_action", "action"):
+            # Matches do not overlap, so look for confirm= inside URLs here.
+            inner = _CONFIRM_QS_RE.search(value)
+            if inner:
+                found.setdefault("confirm_qs", inner.group(1))
+
+    download_url = None
+    if "download_url" in found:
+        download_url = unescape_json_string(found["download_url"])
+    elif "href" in found:
+        download_url = "https://drive.google.com" + found["href"].replace("&amp;", "&")
+
+    form_action = found.get("form_action")
+    if form_action:
+        form_action = form_action.replace("&amp;", "&")
+
+    action_params: dict = {}
+    if "action" in found:
+        action = found["action"].replace("&amp;", "&")
+        params = parse_qs(urlparse(action).query)
+        action_params = {key: values[0] for key, values in params.items() if values}
+
+    return {
+        "download_url": download_url,
+        "token": found.get("confirm_qs")
+        or form_params.get("confirm")
+        or found.get("confirm_json"),
+        "form_action": form_action,
+        "form_params": form_params,
+        "action_params": action_params,
+    }
 
-    match = re.search(r'href="(/uc\?export=download[^"]+)"', html)
-    if match:
-        return "https://drive.google.com" + match.group(1).replace("&amp;", "&")
 
-    return None
+def filename_from_cd(content_disposition: Optional[str]) -> Optional[str]:
+    if not content_disposition:
+        return None
+    plain: Optional[str] = None
+    for match in _CD_FILENAME_RE.finditer(content_disposition):
+        encoded = match.group(1)
+        if encoded is not None:
+            # filename* wins even when it follows the plain filename.
+            return unquote(encoded) if "%" in encoded else encoded
+        if plain is None:
+            plain = match.group(2)
+    return plain
+
+
+def response_length(response) -> Optional[int]:
+    content_length = response.headers.get("content-length")
+    if not content_length:
+        return None
+    try:
+        return int(content_length) or None
+    except ValueError:
+        return None
 
 
-def extract_gdrive_form_action(html: str) -> Optional[str]:
-    match = re.search(r'<form[^>]+id="download-form"[^>]+action="([^"]+)"', html)
-    if match:
-        return match.group(1).replace("&amp;", "&")
-    return None
+@functools.lru_cache(maxsize=None)
+def stream_errors() -> tuple:
+    try:
+        from urllib3.exceptions import ProtocolError, ReadTimeoutError  # type: ignore
+    except ImportError:
+        return ()
+    return (ProtocolError, ReadTimeoutError)
 
 
-def extract_gdrive_form_params(html: str) -> dict:
-    params: dict = {}
-    for name in ("confirm", "uuid", "id", "export"):
-        match = re.search(rf'name="{name}"\s+value="([^"]+)"', html)
-        if match:
-            params[name] = match.group(1)
-    return params
+def range_reopener(response) -> Optional[Callable[[int], object]]:
+    url = getattr(response, "url", None)
+    headers = response.headers
+    # Offsets count decoded bytes, which a Range on an encoded body cannot address.
+    if not url or headers.get("content-encoding", "identity").lower() != "identity":
+        return None
+    if headers.get("accept-ranges", "").lower() == "none":
+        return None
+    validator = headers.get("etag") or headers.get("last-modified")
 
+    def reopen(offset: int):
+        range_headers = {"Range": f"bytes={offset}-"}
+        # If-Range needs a strong validator; without one the Content-Range
+        # check below is what guards against a changed file.
+        if validator and not validator.startswith("W/"):
+            range_headers["If-Range"] = validator
+        return get_http_session().get(url, headers=range_headers, stream=True)
 
-def extract_gdrive_action_params(html: str) -> dict:
-    match = re.search(r'action="([^"]+)"', html)
-    if not match:
-        return {}
-    action = match.group(1).replace("&amp;", "&")
-    parsed = urlparse(action)
-    params = parse_qs(parsed.query)
-    return {key: values[0] for key, values in params.items() if values}
+    return reopen
 
 
-def filename_from_cd(content_disposition: Optional[str]) -> Optional[str]:
-    if not content_disposition:
-        return None
-    match = re.search(r"filename\*=UTF-8''([^;]+)", content_disposition)
-    if match:
-        return unquote(match.group(1))
-    match = re.search(r'filename="?([^";]+)"?', content_disposition)
-    if match:
-        return match.group(1)
-    return None
+def content_range_matches(response, offset: int, total: Optional[int]) -> bool:
+    if response.status_code != 206:
+        return False
+    match = _CONTENT_RANGE_RE.match(response.headers.get("content-range", ""))
+    if not match or int(match.group(1)) != offset:
+        return False
+    return total is None or match.group(2) in ("*", str(total))
+
+
+class ResumableReader:
+    def __init__(self, response, reopen: Optional[Callable[[int], object]]):
+        self.response = response
+        self.raw = response.raw
+        # Let urllib3 undo any Content-Encoding the same way iter_content would.
+        self.raw.decode_content = True
+        self.reopen = reopen
+        self.total = response_length(response)
+        self.offset = 0
+        self.resumed_at = 0
+        self.resumes = 0
+
+    def read(self, size: int = -1) -> bytes:
+        while True:
+            check_aborted()
+            try:
+                data = self.raw.read(size)
+            except stream_errors() as exc:
+                self.resume(exc)
+                continue
+            if not data and self.reopen and self.total and self.offset < self.total:
+                self.resume(
+                    RuntimeError(
+                        f"Connection closed after {self.offset} of {self.total} bytes."
+                    )
+                )
+                continue
+            self.offset += len(data)
+            return data
+
+    def resume(self, error: Exception) -> None:
+        if self.offset > self.resumed_at:
+            self.resumed_at = self.offset
+            self.resumes = 0
+        if self.reopen is None or self.resumes >= DOWNLOAD_RESUME_ATTEMPTS:
+            raise error
+        self.resumes += 1
+        self.response.close()
+        response = self.reopen(self.offset)
+        if not content_range_matches(response, self.offset, self.total):
+            response.close()
+            raise error
+        self.response = response
+        self.raw = response.raw
+        self.raw.decode_content = True
+
+
+@contextlib.contextmanager
+def open_response_reader(response, desc: str, progress: bool):
+    # Read straight from the urllib3 stream so copies run in C. A dropped
+    # connection picks up where it stopped with a Range request.
+    reader = ResumableReader(response, range_reopener(response))
+    tqdm = get_tqdm() if progress else None
+    if not tqdm:
+        yield reader
+        return
+    with tqdm.wrapattr(reader, "read", total=response_length(response), desc=desc) as wrapped:
+        yield wrapped
 
 
 def write_stream_to_file(
@@ -642,64 +1079,103 @@ def write_stream_to_file(
     desc: str,
     progress: bool,
 ) -> None:
-    total = None
-    content_length = response.headers.get("content-length")
-    if content_length:
+    with open_response_reader(response, desc, progress) as reader, target.open(
+        "wb", buffering=DOWNLOAD_BUFFER_SIZE
+    ) as handle:
+        prepare_download_file(handle, response_length(response))
+        shutil.copyfileobj(reader, handle, DOWNLOAD_BUFFER_SIZE)
+        # Drop any preallocated tail, e.g. when the body was decompressed.
+        handle.truncate()
+
+
+def stream_extract_tar(response, dest_dir: Path, desc: str, progress: bool) -> Path:
+    extract_dir = dest_dir / STREAM_EXTRACT_DIR_NAME
+    extract_dir.mkdir()
+    with open_response_reader(response, desc, progress) as reader, tarfile.open(
+        fileobj=reader,
+        mode="r|*",
+        bufsize=DOWNLOAD_BUFFER_SIZE,
+        copybufsize=DOWNLOAD_BUFFER_SIZE,
+    ) as archive:
+        extract_tar_members(archive, extract_dir)
+    if _first_entry(extract_dir) is None:
+        raise RuntimeError(f"Archive extraction produced no files: {desc}")
+    return extract_dir
+
+
+def save_response(
+    response, dest_dir: Path, filename: str, source: str, url: str, progress: bool
+) -> List[Path]:
+    filename = Path(filename).name
+    if detect_archive(Path(filename)) == "tar":
+        # Tar archives are read sequentially, so extract while downloading
+        # instead of writing the archive to disk and reading it back.
         try:
-            total_value = int(content_length)
-        except ValueError:
-            total_value = 0
-        total = total_value or None
+            return [stream_extract_tar(response, dest_dir, filename, progress)]
+        except tarfile.ReadError as exc:
+            raise RuntimeError(
+                f"{source} did not return a readable tar archive for URL: {url} ({exc})"
+            ) from exc
 
-    tqdm = get_tqdm() if progress else None
-    with target.open("wb") as handle:
-        if tqdm:
-            with tqdm(
-                total=total,
-                unit="B",
-                unit_scale=True,
-                unit_divisor=1024,
-                desc=desc,
-            ) as bar:
-                for chunk in response.iter_content(chunk_size=1024 * 256):
-                    if chunk:
-                        handle.write(chunk)
-                        bar.update(len(chunk))
-        else:
-            for chunk in response.iter_content(chunk_size=1024 * 256):
-                if chunk:
-                    handle.write(chunk)
+    target = dest_dir / filename
+    write_stream_to_file(response, target, filename, progress)
+    ensure_not_html_download(target, source, url)
+    return [target]
+
+
+def advise_file(handle, advice: str) -> None:
+    value = getattr(os, advice, None)
+    if value is None or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(handle.fileno(), 0, 0, value)
+    except OSError:
+        pass
+
+
+def prepare_download_file(handle, total: Optional[int]) -> None:
+    advise_file(handle, "POSIX_FADV_SEQUENTIAL")
+    if total and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(handle.fileno(), 0, total)
+        except OSError:
+            pass
 
 
 def save_debug_html(html: str, debug_dir: Optional[Path], stem: str) -> Optional[Path]:
     if debug_dir is None:
         return None
     debug_dir.mkdir(parents=True, exist_ok=True)
-    safe_stem = re.sub(r"[^a-zA-Z0-9_-]+", "_", stem).strip("_") or "gdrive"
+    safe_stem = _UNSAFE_STEM_RE.sub("_", stem).strip("_") or "gdrive"
     debug_path = debug_dir / f"{safe_stem}.html"
     debug_path.write_text(html, encoding="utf-8", errors="replace")
     return debug_path
 
 
 def extract_html_title(html: str) -> Optional[str]:
-    match = re.search(r"<title>(.*?)</title>", html, re.IGNORECASE | re.DOTALL)
+    match = None
+    for limit in HTML_TITLE_SCAN_CHARS:
+        match = _HTML_TITLE_RE.search(html, 0, limit)
+        if match or limit >= len(html):
+            break
     if not match:
         return None
-    title = re.sub(r"\\s+", " ", match.group(1)).strip()
+    title = _WHITESPACE_RE.sub(" ", match.group(1)).strip()
     return title or None
 
 
 def download_google_drive(
-    url: str, dest_dir: Path, debug_dir: Optional[Path], progress: bool
+    url: str,
+    dest_dir: Path,
+    debug_dir: Optional[Path],
+    progress: bool,
+    record: Optional[DownloadRecord] = None,
 ) -> List[Path]:
-    ensure_module("requests", "requests")
-    import requests  # type: ignore
-
     file_id = extract_gdrive_file_id(url)
     if not file_id:
         raise RuntimeError(f"Could not parse Google Drive file ID from URL: {url}")
 
-    session = requests.Session()
+    session = get_http_session()
     base_url = "https://drive.google.com/uc?export=download"
 
     response = session.get(base_url, params={"id": file_id}, stream=True)
@@ -712,12 +1188,12 @@ def download_google_drive(
     if token is None:
         content_type = response.headers.get("content-type", "")
         if "text/html" in content_type:
-            html = response.text
-            download_url = extract_download_url_from_html(html)
-            token = get_confirm_token_from_html(html)
-            form_action = extract_gdrive_form_action(html)
-            form_params = extract_gdrive_form_params(html)
-            action_params = extract_gdrive_action_params(html)
+            page = parse_gdrive_html(response.text)
+            download_url = page["download_url"]
+            token = page["token"]
+            form_action = page["form_action"]
+            form_params = page["form_params"]
+            action_params = page["action_params"]
             response.close()
             if download_url:
                 response = session.get(download_url, stream=True)
@@ -755,25 +1231,24 @@ def download_google_drive(
             "Google Drive returned HTML instead of a file. "
             f"Check sharing permissions.{hint}{debug_hint}"
         )
+    if is_unchanged_download(response, record):
+        response.close()
+        return []
     filename = filename_from_cd(response.headers.get("content-disposition"))
     if not filename:
         filename = f"{file_id}"
 
-    filename = Path(filename).name
-    target = dest_dir / filename
-    write_stream_to_file(response, target, filename, progress)
-    ensure_not_html_download(target, "Google Drive", url)
-    return [target]
+    return save_response(response, dest_dir, filename, "Google Drive", url, progress)
 
 
 def filename_from_url(url: str) -> Optional[str]:
-    parsed = urlparse(url)
+    parsed = _cached_urlparse(url)
     name = Path(parsed.path).name
     return unquote(name) if name else None
 
 
 def is_http_url(url: str) -> bool:
-    parsed = urlparse(url)
+    parsed = _cached_urlparse(url)
     return parsed.scheme in ("http", "https")
 
 
@@ -791,12 +1266,17 @@ def is_probably_html_file(path: Path) -> bool:
     if suffix in (".html", ".htm", ".xhtml", ".shtml"):
         return True
 
-    text = read_text_prefix(path).lstrip().lower()
-    if not text:
+    # Sniff raw bytes: archives are never decoded just to rule them out.
+    try:
+        with path.open("rb") as handle:
+            head = handle.read(HTML_SNIFF_BYTES).lstrip().lower()
+    except OSError:
+        return False
+    if not head:
         return False
-    if text.startswith("<!doctype html") or text.startswith("<html"):
+    if head.startswith((b"<!doctype html", b"<html")):
         return True
-    return "<html" in text[:4096] and ("<head" in text[:4096] or "<body" in text[:4096])
+    return b"<html" in head and (b"<head" in head or b"<body" in head)
 
 
 def ensure_not_html_download(path: Path, source: str, url: str) -> None:
@@ -810,10 +1290,11 @@ def ensure_not_html_download(path: Path, source: str, url: str) -> None:
 
 
 def download_with_wget(url: str, dest_dir: Path, progress: bool) -> List[Path]:
-    if not shutil.which("wget"):
+    if not _which("wget"):
         raise RuntimeError("wget is not installed.")
 
-    before = {entry.resolve() for entry in dest_dir.iterdir()}
+    with os.scandir(dest_dir) as entries:
+        before = {entry.name for entry in entries}
     cmd = [
         "wget",
         "--content-disposition",
@@ -830,8 +1311,9 @@ def download_with_wget(url: str, dest_dir: Path, progress: bool) -> List[Path]:
 
     run(cmd)
 
-    files = [entry for entry in dest_dir.iterdir() if entry.is_file()]
-    created = [entry for entry in files if entry.resolve() not in before]
+    with os.scandir(dest_dir) as entries:
+        files = [Path(entry.path) for entry in entries if entry.is_file()]
+    created = [entry for entry in files if entry.name not in before]
     if created:
         candidates = created
     elif files:
@@ -844,12 +1326,11 @@ def download_with_wget(url: str, dest_dir: Path, progress: bool) -> List[Path]:
     return [downloaded]
 
 
-def download_dropbox(url: str, dest_dir: Path, progress: bool) -> List[Path]:
-    ensure_module("requests", "requests")
-    import requests  # type: ignore
-
+def download_dropbox(
+    url: str, dest_dir: Path, progress: bool, record: Optional[DownloadRecord] = None
+) -> List[Path]:
     download_url = normalize_dropbox_url(url)
-    response = requests.get(download_url, stream=True, allow_redirects=True)
+    response = get_http_session().get(download_url, stream=True, allow_redirects=True)
     response.raise_for_status()
 
     content_type = response.headers.get("content-type", "")
@@ -857,6 +1338,9 @@ def download_dropbox(url: str, dest_dir: Path, progress: bool) -> List[Path]:
         raise RuntimeError(
             "Dropbox returned HTML instead of a file. Check sharing permissions."
         )
+    if is_unchanged_download(response, record):
+        response.close()
+        return []
 
     filename = filename_from_cd(response.headers.get("content-disposition"))
     if not filename:
@@ -864,24 +1348,20 @@ def download_dropbox(url: str, dest_dir: Path, progress: bool) -> List[Path]:
     if not filename:
         raise RuntimeError("Could not determine Dropbox filename.")
 
-    filename = Path(filename).name
-    target = dest_dir / filename
-    write_stream_to_file(response, target, filename, progress)
-    ensure_not_html_download(target, "Dropbox", url)
-    return [target]
-
+    return save_response(response, dest_dir, filename, "Dropbox", url, progress)
 
-def download_yandex_disk(url: str, dest_dir: Path, progress: bool) -> List[Path]:
-    ensure_module("requests", "requests")
-    import requests  # type: ignore
 
+def download_yandex_disk(
+    url: str, dest_dir: Path, progress: bool, record: Optional[DownloadRecord] = None
+) -> List[Path]:
+    session = get_http_session()
     download_url = url
     if not is_yandex_direct(url):
         public_url, public_path = parse_yandex_public_url(url)
         params = {"public_key": public_url}
         if public_path:
             params["path"] = public_path
-        response = requests.get(
+        response = session.get(
             "https://cloud-api.yandex.net/v1/disk/public/resources/download",
             params=params,
         )
@@ -895,7 +1375,7 @@ def download_yandex_disk(url: str, dest_dir: Path, progress: bool) -> List[Path]
             raise RuntimeError(f"Yandex Disk download error: {error}{hint}")
         download_url = href
 
-    response = requests.get(download_url, stream=True, allow_redirects=True)
+    response = session.get(download_url, stream=True, allow_redirects=True)
     response.raise_for_status()
 
     content_type = response.headers.get("content-type", "")
@@ -903,6 +1383,9 @@ def download_yandex_disk(url: str, dest_dir: Path, progress: bool) -> List[Path]
         raise RuntimeError(
             "Yandex Disk returned HTML instead of a file. Check sharing permissions."
         )
+    if is_unchanged_download(response, record):
+        response.close()
+        return []
 
     filename = filename_from_cd(response.headers.get("content-disposition"))
     if not filename:
@@ -910,22 +1393,13 @@ def download_yandex_disk(url: str, dest_dir: Path, progress: bool) -> List[Path]
     if not filename:
         raise RuntimeError("Could not determine Yandex Disk filename.")
 
-    filename = Path(filename).name
-    target = dest_dir / filename
-    write_stream_to_file(response, target, filename, progress)
-    ensure_not_html_download(target, "Yandex Disk", url)
-    return [target]
+    return save_response(response, dest_dir, filename, "Yandex Disk", url, progress)
 
 
 def download_mega(url: str, dest_dir: Path) -> List[Path]:
-    if shutil.which("mega-get"):
+    if _which("mega-get"):
         run(["mega-get", url, str(dest_dir)])
-        items = list(dest_dir.iterdir())
-        if not items:
-            raise RuntimeError("Mega download did not create any files.")
-        return items
-
-    if shutil.which("megadl"):
+    elif _which("megadl"):
         info = parse_mega_link(url)
         if info and info.get("kind") == "folder_file":
             try:
@@ -948,28 +1422,22 @@ def download_mega(url: str, dest_dir: Path) -> List[Path]:
                     file=sys.stderr,
                 )
             run(["megadl", "--path", str(dest_dir), mega_url])
-        items = list(dest_dir.iterdir())
-        if not items:
-            raise RuntimeError("Mega download did not create any files.")
-        return items
-
-    if sys.version_info >= (3, 13):
+    elif sys.version_info >= (3, 13):
         raise RuntimeError(
             "Python 3.13 is not compatible with mega.py. "
             "Install MegaCMD (mega-get) or megatools (megadl), "
             "or use Python 3.12/3.11."
         )
+    else:
+        from mega import Mega  # type: ignore
 
-    ensure_module("mega", "mega.py")
-    from mega import Mega  # type: ignore
-
-    mega = Mega()
-    try:
-        mega.download_url(url, str(dest_dir))
-    except Exception as exc:  # pragma: no cover
-        raise RuntimeError(f"Mega download failed: {exc}") from exc
+        mega = Mega()
+        try:
+            mega.download_url(url, str(dest_dir))
+        except Exception as exc:  # pragma: no cover
+            raise RuntimeError(f"Mega download failed: {exc}") from exc
 
-    items = list(dest_dir.iterdir())
+    items = list_dir(dest_dir)
     if not items:
         raise RuntimeError("Mega download did not create any files.")
     return items
@@ -978,14 +1446,15 @@ def download_mega(url: str, dest_dir: Path) -> List[Path]:
 def download_telegram(
     url: str, dest_dir: Path, config: TelegramConfig, progress: bool
 ) -> List[Path]:
-    ensure_module("telethon", "telethon")
     from telethon.sync import TelegramClient  # type: ignore
 
     info = parse_telegram_message_url(url)
     if not info:
         raise RuntimeError(f"Unsupported Telegram message URL: {url}")
 
-    with TelegramClient(config.session, config.api_id, config.api_hash) as client:
+    with _TELEGRAM_LOCK, TelegramClient(
+        config.session, config.api_id, config.api_hash
+    ) as client:
         client.start()
         message = client.get_messages(info["peer"], ids=info["msg_id"])
         if not message:
@@ -1015,7 +1484,7 @@ def download_telegram(
                 unit_divisor=1024,
                 desc="Telegram",
             ) as bar:
-                with target.open("wb") as handle:
+                with target.open("wb", buffering=DOWNLOAD_BUFFER_SIZE) as handle:
                     for chunk in client.iter_download(message.media):
                         handle.write(chunk)
                         bar.update(len(chunk))
@@ -1041,63 +1510,212 @@ def download_telegram(
 
 
 def detect_archive(path: Path) -> Optional[str]:
-    name = path.name.lower()
-    if name.endswith(".zip"):
-        return "zip"
-    if name.endswith(ARCHIVE_TAR_EXTS):
-        return "tar"
-    if name.endswith(ARCHIVE_7Z_EXTS):
-        return "7z"
+    parts = path.name.lower().rsplit(".", 2)
+    # Double suffixes first so "x.tar.gz" is not looked up as ".gz".
+    if len(parts) == 3:
+        kind = ARCHIVE_KINDS.get(f".{parts[1]}.{parts[2]}")
+        if kind:
+            return kind
+    if len(parts) >= 2:
+        return ARCHIVE_KINDS.get(f".{parts[-1]}")
     return None
 
 
+@contextlib.contextmanager
+def open_archive(archive_path: Path, sequential: bool = True):
+    with archive_path.open("rb") as handle:
+        if sequential:
+            advise_file(handle, "POSIX_FADV_SEQUENTIAL")
+        yield handle
+        # The archive is discarded after extraction; free its page cache for
+        # the extracted files.
+        advise_file(handle, "POSIX_FADV_DONTNEED")
+
+
+def extract_zip_member(
+    archive: zipfile.ZipFile, member: zipfile.ZipInfo, dest_dir: Path
+) -> None:
+    try:
+        archive.extract(member, dest_dir)
+    except FileExistsError:
+        # Another thread created the same parent directory first.
+        archive.extract(member, dest_dir)
+
+
+def extract_zip(archive_path: Path, dest_dir: Path) -> None:
+    # The sequential hint only holds for the serial path; parallel workers
+    # read members at scattered offsets.
+    with open_archive(archive_path, sequential=False) as handle, zipfile.ZipFile(
+        handle
+    ) as archive:
+        members = archive.infolist()
+        if len(members) < ZIP_PARALLEL_MIN_MEMBERS:
+            advise_file(handle, "POSIX_FADV_SEQUENTIAL")
+            archive.extractall(dest_dir)
+            return
+        # Every entry is its own deflate stream and zlib releases the GIL,
+        # so members inflate in parallel; ZipFile serializes the reads.
+        workers = min(MAX_ZIP_WORKERS, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(
+                executor.map(
+                    functools.partial(extract_zip_member, archive, dest_dir=dest_dir),
+                    members,
+                )
+            )
+
+
+def is_within(root: str, path: str) -> bool:
+    return os.path.commonpath([root, path]) == root
+
+
+def checked_tar_members(archive: tarfile.TarFile, root: str):
+    # Checked lazily, right before each member is written, so links that
+    # earlier members created are resolved as they are on disk.
+    for member in archive:
+        target = os.path.realpath(os.path.join(root, member.name))
+        if not is_within(root, target):
+            raise RuntimeError(f"Refusing to extract {member.name!r}: outside destination.")
+        if member.issym():
+            link = os.path.join(os.path.dirname(target), member.linkname)
+        elif member.islnk():
+            link = os.path.join(root, member.linkname)
+        elif member.isfile() or member.isdir():
+            link = None
+        else:
+            raise RuntimeError(f"Refusing to extract {member.name!r}: special file.")
+        if link is not None and not is_within(root, os.path.realpath(link)):
+            raise RuntimeError(
+                f"Refusing to extract {member.name!r}: link points outside destination."
+            )
+        member.mode &= ~(stat.S_ISUID | stat.S_ISGID)
+        yield member
+
+
+def extract_tar_members(archive: tarfile.TarFile, dest_dir: Path) -> None:
+    # Downloads are untrusted: never let a member land outside dest_dir.
+    if hasattr(tarfile, "data_filter"):
+        try:
+            archive.extractall(dest_dir, filter="data")
+        except tarfile.FilterError as exc:
+            raise RuntimeError(f"Refusing to extract unsafe archive member: {exc}") from exc
+        return
+    # Pythons without extraction filters get the same path and link checks.
+    root = os.path.realpath(dest_dir)
+    archive.extractall(dest_dir, members=checked_tar_members(archive, root))
+
+
+def extract_tar(archive_path: Path, dest_dir: Path) -> None:
+    with open_archive(archive_path) as handle, tarfile.open(
+        fileobj=handle, mode="r:*", copybufsize=DOWNLOAD_BUFFER_SIZE
+    ) as archive:
+        extract_tar_members(archive, dest_dir)
+
+
 def extract_archive(archive_path: Path, dest_dir: Path) -> None:
     dest_dir.mkdir(parents=True, exist_ok=True)
     kind = detect_archive(archive_path)
     if kind == "zip":
-        # unzip returns 1 for warnings (e.g., filename encoding). Treat as success if files extracted.
         try:
-            run(
-                ["unzip", "-qq", "-o", str(archive_path), "-d", str(dest_dir)],
-                ok_codes=(0, 1),
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-            )
-        except subprocess.CalledProcessError:
-            # Fallback to 7z if unzip fails hard.
-            run(["7z", "x", "-y", f"-o{dest_dir}", str(archive_path)])
+            extract_zip(archive_path, dest_dir)
+        except (zipfile.BadZipFile, NotImplementedError):
+            # Damaged archives or unsupported compression (e.g. Deflate64).
+            # unzip returns 1 for warnings (e.g., filename encoding). Treat as success if files extracted.
+            try:
+                run(
+                    ["unzip", "-qq", "-o", str(archive_path), "-d", str(dest_dir)],
+                    ok_codes=(0, 1),
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+            except subprocess.CalledProcessError:
+                # Fallback to 7z if unzip fails hard.
+                run(["7z", "x", "-y", f"-o{dest_dir}", str(archive_path)])
     elif kind == "tar":
-        run(["tar", "-xf", str(archive_path), "-C", str(dest_dir)])
+        try:
+            extract_tar(archive_path, dest_dir)
+        except (tarfile.ReadError, tarfile.CompressionError):
+            # Compression tarfile cannot read (e.g. zstd); GNU tar may.
+            run(["tar", "-xf", str(archive_path), "-C", str(dest_dir)])
     elif kind == "7z":
         run(["7z", "x", "-y", f"-o{dest_dir}", str(archive_path)])
     else:
         raise RuntimeError(f"Unsupported archive type: {archive_path}")
-    if not any(dest_dir.iterdir()):
+    if _first_entry(dest_dir) is None:
         raise RuntimeError(f"Archive extraction produced no files: {archive_path}")
 
 
+def copy_file(src: str, dst: str) -> str:
+    # Used by shutil.move when a rename crosses filesystems. copy_file_range
+    # copies inside the kernel and can reflink or offload on filesystems
+    # that support it; shutil.copy2 (sendfile) covers everything else.
+    if hasattr(os, "copy_file_range"):
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            try:
+                while copied < size:
+                    count = os.copy_file_range(
+                        fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK_SIZE, size - copied)
+                    )
+                    # Some filesystems report 0 without copying anything.
+                    if not count:
+                        break
+                    copied += count
+            except OSError as exc:
+                if copied or exc.errno not in COPY_FILE_RANGE_UNSUPPORTED:
+                    raise
+        if copied == size:
+            shutil.copystat(src, dst)
+            return dst
+    # copy2 rewrites dst from the start, so a short copy above is not kept.
+    return shutil.copy2(src, dst)
+
+
+def stat_mode(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mode
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
 def move_or_merge(src: Path, dest_root: Path, force: bool) -> Path:
     dest = dest_root / src.name
-    if not dest.exists():
-        shutil.move(str(src), str(dest))
+    # One stat per side instead of a pathlib exists/is_dir/is_file call for
+    # every check; symlinks are followed as those calls did.
+    dest_mode = stat_mode(dest)
+    if dest_mode is None:
+        shutil.move(str(src), str(dest), copy_function=copy_file)
         return dest
 
-    if src.is_dir() and dest.is_dir():
-        shutil.copytree(src, dest, dirs_exist_ok=True)
-        shutil.rmtree(src)
+    src_mode = stat_mode(src)
+    if src_mode is None:
+        # Check before anything in dest is removed to make room for it.
+        raise RuntimeError(f"Source disappeared before install: {src}")
+    if stat.S_ISDIR(src_mode) and stat.S_ISDIR(dest_mode):
+        # Merge child by child: entries missing from dest are renamed in
+        # place (no copy on the same filesystem), collisions recurse.
+        for child in list_dir(src):
+            move_or_merge(child, dest, force)
+        src.rmdir()
         return dest
 
-    if src.is_file() and dest.is_file():
-        dest.unlink()
-        shutil.move(str(src), str(dest))
+    if stat.S_ISREG(src_mode) and stat.S_ISREG(dest_mode):
+        try:
+            os.replace(src, dest)
+        except OSError as exc:
+            if exc.errno != errno.EXDEV:
+                raise
+            dest.unlink()
+            shutil.move(str(src), str(dest), copy_function=copy_file)
         return dest
 
     if force:
-        if dest.is_dir():
+        if stat.S_ISDIR(dest_mode):
             shutil.rmtree(dest)
         else:
             dest.unlink()
-        shutil.move(str(src), str(dest))
+        shutil.move(str(src), str(dest), copy_function=copy_file)
         return dest
 
     raise RuntimeError(
@@ -1105,10 +1723,52 @@ def move_or_merge(src: Path, dest_root: Path, force: bool) -> Path:
     )
 
 
+def resolve_owner(owner: str) -> tuple[int, int]:
+    user, _, group = owner.partition(":")
+    try:
+        if not user:
+            uid = -1
+        else:
+            uid = int(user) if user.isdigit() else pwd.getpwnam(user).pw_uid
+        if not group:
+            gid = -1
+        else:
+            gid = int(group) if group.isdigit() else grp.getgrnam(group).gr_gid
+    except KeyError as exc:
+        raise RuntimeError(f"Unknown owner: {owner}") from exc
+    return uid, gid
+
+
+def chown_tree(path: str, uid: int, gid: int) -> None:
+    os.lchown(path, uid, gid)
+    if os.path.islink(path) or not os.path.isdir(path):
+        return
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.lchown(os.path.join(root, name), uid, gid)
+
+
 def chown_paths(paths: Iterable[Path], owner: str) -> None:
-    path_list = [str(p) for p in paths]
-    if path_list:
-        run(["chown", "-R", owner, *path_list])
+    # The same module can be reported by several URLs; chown it once.
+    path_list = list(dict.fromkeys(str(p) for p in paths))
+    if not path_list:
+        return
+
+    uid, gid = resolve_owner(owner)
+    if len(path_list) == 1:
+        chown_tree(path_list[0], uid, gid)
+        return
+    # lchown and the directory scans release the GIL, so module trees are
+    # walked side by side.
+    workers = min(MAX_CHOWN_WORKERS, len(path_list))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(functools.partial(chown_tree, uid=uid, gid=gid), path_list))
+
+
+def install_item(item: Path, modules_dir: Path, force: bool) -> Path:
+    with _MODULES_DIR_LOCK:
+        check_aborted()
+        return move_or_merge(item, modules_dir, force)
 
 
 def process_downloads(
@@ -1119,8 +1779,14 @@ def process_downloads(
 ) -> List[Path]:
     moved: List[Path] = []
     for item in downloaded:
+        if item.name == STREAM_EXTRACT_DIR_NAME and item.is_dir():
+            # Already extracted while downloading; install its contents.
+            for extracted in list_dir(item):
+                moved.append(install_item(extracted, modules_dir, force))
+            continue
+
         if item.is_dir():
-            moved.append(move_or_merge(item, modules_dir, force))
+            moved.append(install_item(item, modules_dir, force))
             continue
 
         kind = detect_archive(item)
@@ -1131,13 +1797,11 @@ def process_downloads(
             ) as extract_tmp:
                 extract_dir = Path(extract_tmp)
                 extract_archive(item, extract_dir)
-                extracted_items = list(extract_dir.iterdir())
-                if not extracted_items:
-                    raise RuntimeError(f"Archive is empty: {item}")
-                for extracted in extracted_items:
-                    moved.append(move_or_merge(extracted, modules_dir, force))
+                # Listed up front: entries are moved out while we iterate.
+                for extracted in list_dir(extract_dir):
+                    moved.append(install_item(extracted, modules_dir, force))
         else:
-            moved.append(move_or_merge(item, modules_dir, force))
+            moved.append(install_item(item, modules_dir, force))
 
     return moved
 
@@ -1148,16 +1812,17 @@ def download_url(
     debug_dir: Optional[Path],
     telegram: Optional[TelegramConfig],
     progress: bool,
+    record: Optional[DownloadRecord] = None,
 ) -> List[Path]:
     http_fallback = is_http_url(url)
     primary_error: Optional[Exception] = None
     try:
         if is_yandex_disk(url) or is_yandex_direct(url):
-            return download_yandex_disk(url, dest_dir, progress)
+            return download_yandex_disk(url, dest_dir, progress, record)
         if is_google_drive(url):
-            return download_google_drive(url, dest_dir, debug_dir, progress)
+            return download_google_drive(url, dest_dir, debug_dir, progress, record)
         if is_dropbox(url):
-            return download_dropbox(url, dest_dir, progress)
+            return download_dropbox(url, dest_dir, progress, record)
         if is_mega(url):
             return download_mega(url, dest_dir)
         if is_telegram(url):
@@ -1190,6 +1855,91 @@ def download_url(
         raise
 
 
+def install_url(
+    url: str,
+    modules_dir: Path,
+    explicit_work_dir: Optional[Path],
+    debug_dir: Optional[Path],
+    telegram: Optional[TelegramConfig],
+    force: bool,
+    progress: bool,
+    cache: Optional[dict] = None,
+) -> List[Path]:
+    record: Optional[DownloadRecord] = None
+    if cache is not None:
+        # --force reinstalls everything but still records fresh entries.
+        previous = None if force else cache.get(url)
+        if is_immutable_url(url) and cached_paths_exist(previous):
+            skip_installed(url, previous)
+            return []
+        record = DownloadRecord(previous=previous)
+
+    expected_size = estimate_download_size(url, telegram)
+    work_dir = select_work_dir(explicit_work_dir, expected_size)
+    if work_dir:
+        work_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(
+        prefix="foundry_download_",
+        dir=str(work_dir) if work_dir else None,
+    ) as tmp_dir:
+        downloaded = download_url(url, Path(tmp_dir), debug_dir, telegram, progress, record)
+        if record is not None and record.unchanged:
+            skip_installed(url, record.previous)
+            return []
+        moved = process_downloads(downloaded, modules_dir, force, work_dir)
+
+    if cache is not None and moved:
+        if record.validator is not None or is_immutable_url(url):
+            with _MODULES_DIR_LOCK:
+                cache[url] = {
+                    "validator": record.validator,
+                    "paths": [str(path) for path in moved],
+                }
+    return moved
+
+
+def is_immutable_url(url: str) -> bool:
+    kind = classify_url(url)
+    if kind == "telegram":
+        return True
+    if kind == "mega":
+        info = parse_mega_link(url)
+        return info is not None and info["kind"] in IMMUTABLE_MEGA_KINDS
+    return False
+
+
+def skip_installed(url: str, entry: dict) -> None:
+    # Reported here only: skipped modules are neither listed as installed
+    # nor re-chowned.
+    paths = [Path(path) for path in entry["paths"]]
+    print(
+        f"Already up to date, skipping download: {url} ({summarize_paths(paths)})",
+        file=sys.stderr,
+    )
+
+
+def install_urls(urls: List[str], max_workers: int, **kwargs) -> List[Path]:
+    results: List[List[Path]] = [[] for _ in urls]
+    _ABORT.clear()
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls))))
+    try:
+        futures = {
+            executor.submit(install_url, url, **kwargs): index
+            for index, url in enumerate(urls)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    except BaseException as exc:
+        if isinstance(exc, KeyboardInterrupt):
+            _ABORT.set()
+        # Wait for installs in flight (aborted ones stop at their next read
+        # or install) so the cache main saves next matches the modules dir.
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return [path for moved in results for path in moved]
+
+
 def parse_telegram_config(args: argparse.Namespace) -> Optional[TelegramConfig]:
     api_id = (
         args.tg_api_id
@@ -1256,9 +2006,9 @@ def main() -> int:
                 Path(__file__).resolve().parent / ".env",
                 Path.home() / ".config" / "foundry-module-downloader" / ".env",
             ]
-            for candidate in candidate_paths:
-                if load_dotenv(candidate):
-                    break
+            env_path = next((p for p in candidate_paths if p.is_file()), None)
+            if env_path is not None:
+                load_dotenv(env_path)
 
     parser = argparse.ArgumentParser(
         description=(
@@ -1290,7 +2040,10 @@ def main() -> int:
     parser.add_argument(
         "--force",
         action="store_true",
-        help="Overwrite existing module files if name conflicts",
+        help=(
+            "Overwrite existing module files if name conflicts; "
+            "also re-download URLs the cache marks as unchanged."
+        ),
     )
     parser.add_argument(
         "--work-dir",
@@ -1306,6 +2059,23 @@ def main() -> int:
         action="store_true",
         help="Disable tqdm progress bars (still shows Mega CLI progress).",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=MAX_PARALLEL_DOWNLOADS,
+        help=(
+            "Maximum number of URLs downloaded at the same time "
+            f"(default: {MAX_PARALLEL_DOWNLOADS})."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            f"Always download, ignoring {DOWNLOAD_CACHE_NAME} in the modules "
+            "directory (used to skip unchanged URLs on re-runs)."
+        ),
+    )
     parser.add_argument(
         "--cleanup-temp",
         action="store_true",
@@ -1348,11 +2118,15 @@ def main() -> int:
     )
 
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
     modules_dir = Path(args.modules_dir)
     modules_dir.mkdir(parents=True, exist_ok=True)
 
     debug_dir = Path(args.debug_html).expanduser() if args.debug_html else None
     explicit_work_dir = Path(args.work_dir).expanduser() if args.work_dir else None
+    if explicit_work_dir is None:
+        explicit_work_dir = same_filesystem_work_dir(modules_dir)
 
     base_tmp_dirs = [Path(tempfile.gettempdir())]
     if DEFAULT_FALLBACK_TMP_DIR.is_dir():
@@ -1381,26 +2155,29 @@ def main() -> int:
     telegram = parse_telegram_config(args)
     progress_enabled = not args.no_progress
 
-    all_moved: List[Path] = []
-    for url in args.url:
-        expected_size = estimate_download_size(url, telegram)
-        work_dir = select_work_dir(explicit_work_dir, expected_size)
-        if work_dir:
-            work_dir.mkdir(parents=True, exist_ok=True)
-        with tempfile.TemporaryDirectory(
-            prefix="foundry_download_",
-            dir=str(work_dir) if work_dir else None,
-        ) as tmp_dir:
-            tmp_path = Path(tmp_dir)
-            downloaded = download_url(
-                url,
-                tmp_path,
-                debug_dir,
-                telegram,
-                progress_enabled,
-            )
-            moved = process_downloads(downloaded, modules_dir, args.force, work_dir)
-            all_moved.extend(moved)
+    # One pip run for everything this batch needs instead of one per backend.
+    try:
+        ensure_modules(required_modules(args.url, progress_enabled, telegram))
+    except (RuntimeError, subprocess.CalledProcessError) as exc:
+        print(f"Warning: could not install Python dependencies ({exc}).", file=sys.stderr)
+
+    cache = None if args.no_cache else load_download_cache(modules_dir)
+    try:
+        all_moved = install_urls(
+            args.url,
+            args.jobs,
+            modules_dir=modules_dir,
+            explicit_work_dir=explicit_work_dir,
+            debug_dir=debug_dir,
+            telegram=telegram,
+            force=args.force,
+            progress=progress_enabled,
+            cache=cache,
+        )
+    finally:
+        # Keep what finished even if another URL failed.
+        if cache:
+            save_download_cache(modules_dir, cache)
 
     if all_moved:
         chown_paths(all_moved, args.owner)
@@ -1,15 +1,34 @@
+import errno
+import io
+import os
+import subprocess
 import sys
+import tarfile
+import threading
+import types
+import zipfile
 from pathlib import Path
 
 import pytest
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+try:
+    from urllib3.exceptions import ProtocolError
+except ImportError:  # requests (and with it urllib3) is optional
+    ProtocolError = None
+
+import foundry_module_fetch as fetch
 from foundry_module_fetch import (
     TelegramConfig,
+    chown_paths,
+    classify_url,
+    detect_archive,
     ensure_not_html_download,
     estimate_download_size,
+    extract_archive,
     extract_gdrive_file_id,
+    extract_html_title,
     filename_from_cd,
     is_dropbox,
     is_google_drive,
@@ -17,10 +36,17 @@ from foundry_module_fetch import (
     is_probably_html_file,
     is_telegram,
     is_yandex_disk,
+    load_dotenv,
+    move_or_merge,
     normalize_dropbox_url,
+    parse_gdrive_html,
     parse_mega_link,
     parse_telegram_message_url,
     parse_yandex_public_url,
+    process_downloads,
+    resolve_owner,
+    save_response,
+    write_stream_to_file,
 )
 
 
@@ -70,6 +96,27 @@ class TestUrlDetection:
     def test_not_telegram(self):
         assert not is_telegram("https://example.com/t.me/abc")
 
+    def test_telegram_without_scheme(self):
+        assert is_telegram("t.me/channel/123")
+
+
+class TestClassifyUrl:
+    def test_known_hosts(self):
+        assert classify_url("https://drive.google.com/file/d/abc/view") == "gdrive"
+        assert classify_url("https://mega.co.nz/#F!abc!key") == "mega"
+        assert classify_url("https://dl.dropboxusercontent.com/s/abc") == "dropbox"
+        assert classify_url("https://telegram.dog/channel/1") == "telegram"
+
+    def test_host_with_port_and_case(self):
+        assert classify_url("https://WWW.Dropbox.com:443/s/abc") == "dropbox"
+
+    def test_suffix_must_match_whole_label(self):
+        assert classify_url("https://notdropbox.com/s/abc") is None
+        assert classify_url("https://google.com/drive") is None
+
+    def test_unknown_host(self):
+        assert classify_url("https://example.com/file.zip") is None
+
 
 class TestGoogleDriveFileId:
     def test_standard_url(self):
@@ -88,6 +135,71 @@ class TestGoogleDriveFileId:
         assert extract_gdrive_file_id("https://drive.google.com/drive/folders/abc") is None
 
 
+class TestGoogleDriveHtml:
+    FORM = (
+        '<form id="download-form" action="https://drive.usercontent.google.com/download">'
+        '<input type="hidden" name="id" value="FILEID">'
+        '<input type="hidden" name="export" value="download">'
+        '<input type="hidden" name="confirm" value="t">'
+        '<input type="hidden" name="uuid" value="UUID">'
+        "</form>"
+    )
+
+    def test_form_params(self):
+        assert parse_gdrive_html(self.FORM)["form_params"] == {
+            "id": "FILEID",
+            "export": "download",
+            "confirm": "t",
+            "uuid": "UUID",
+        }
+
+    def test_form_params_keep_first_value(self):
+        html = self.FORM + '<input name="id" value="OTHER">'
+        assert parse_gdrive_html(html)["form_params"]["id"] == "FILEID"
+
+    def test_confirm_token_from_query(self):
+        assert parse_gdrive_html('href="/uc?export=download&confirm=AbC_1"')["token"] == "AbC_1"
+
+    def test_confirm_token_from_input(self):
+        assert parse_gdrive_html(self.FORM)["token"] == "t"
+
+    def test_confirm_token_from_json(self):
+        assert parse_gdrive_html("var data = {'confirm': 'xyz'}")["token"] == "xyz"
+
+    def test_confirm_token_missing(self):
+        assert parse_gdrive_html("<html></html>")["token"] is None
+
+    def test_parse_download_form(self):
+        html = self.FORM.replace(
+            'action="https://drive.usercontent.google.com/download"',
+            'action="https://drive.usercontent.google.com/download?id=FILEID&amp;confirm=qs"',
+        )
+        page = parse_gdrive_html(html)
+        assert page["form_action"] == (
+            "https://drive.usercontent.google.com/download?id=FILEID&confirm=qs"
+        )
+        assert page["action_params"] == {"id": "FILEID", "confirm": "qs"}
+        assert page["form_params"]["uuid"] == "UUID"
+        # confirm= anywhere in the page outranks the hidden input.
+        assert page["token"] == "qs"
+        assert page["download_url"] is None
+
+    def test_parse_download_url_json(self):
+        html = '{"downloadUrl":"https:\\/\\/drive.google.com\\/uc?id\\u003dX\\u0026export\\u003ddownload"}'
+        page = parse_gdrive_html(html)
+        assert page["download_url"] == "https://drive.google.com/uc?id=X&export=download"
+
+    def test_parse_download_url_other_escapes(self):
+        html = '{"downloadUrl":"https://drive.google.com/uc\\u003fid\\u003dX"}'
+        assert parse_gdrive_html(html)["download_url"] == "https://drive.google.com/uc?id=X"
+
+    def test_parse_download_href(self):
+        html = '<a href="/uc?export=download&amp;confirm=abc&amp;id=X">Download</a>'
+        page = parse_gdrive_html(html)
+        assert page["download_url"] == "https://drive.google.com/uc?export=download&confirm=abc&id=X"
+        assert page["token"] == "abc"
+
+
 class TestMegaLink:
     def test_file_link(self):
         info = parse_mega_link("https://mega.nz/file/FILEID#KEY")
@@ -123,6 +235,12 @@ class TestMegaLink:
     def test_non_mega(self):
         assert parse_mega_link("https://example.com/file") is None
 
+    def test_base_keeps_host_and_ignores_query(self):
+        info = parse_mega_link("https://mega.co.nz/file/FILEID?x=1#KEY")
+        assert info is not None
+        assert info["base"] == "https://mega.co.nz"
+        assert info["key"] == "KEY"
+
 
 class TestTelegramUrl:
     def test_public_channel(self):
@@ -149,6 +267,10 @@ class TestTelegramUrl:
     def test_missing_msg_id(self):
         assert parse_telegram_message_url("https://t.me/mychannel") is None
 
+    def test_without_scheme(self):
+        info = parse_telegram_message_url("t.me/mychannel/42?single")
+        assert info == {"peer": "mychannel", "msg_id": 42}
+
 
 class TestDropboxNormalize:
     def test_adds_dl_param(self):
@@ -196,6 +318,13 @@ class TestFilenameFromCd:
     def test_unquoted(self):
         assert filename_from_cd("attachment; filename=archive.zip") == "archive.zip"
 
+    def test_rfc5987_preferred_over_plain(self):
+        cd = "attachment; filename=\"fallback.zip\"; filename*=UTF-8''%D0%BC.zip"
+        assert filename_from_cd(cd) == "\u043c.zip"
+
+    def test_rfc5987_without_escapes(self):
+        assert filename_from_cd("attachment; filename*=UTF-8''plain.zip") == "plain.zip"
+
     def test_none(self):
         assert filename_from_cd(None) is None
 
@@ -203,6 +332,29 @@ class TestFilenameFromCd:
         assert filename_from_cd("") is None
 
 
+class TestHtmlTitle:
+    def test_collapses_whitespace(self):
+        html = "<html><head><TITLE>\n  Google   Drive\t- Error\n</TITLE></head></html>"
+        assert extract_html_title(html) == "Google Drive - Error"
+
+    def test_missing_title(self):
+        assert extract_html_title("<html></html>") is None
+
+    def test_blank_title(self):
+        assert extract_html_title("<title>  </title>") is None
+
+    def test_title_with_attributes(self):
+        assert extract_html_title('<title dir="ltr">Drive</title>') == "Drive"
+
+    def test_title_after_large_head(self):
+        html = "<head>" + " " * 20000 + "<title>Late</title>"
+        assert extract_html_title(html) == "Late"
+
+    def test_title_beyond_scan_window_ignored(self):
+        html = "<body>" + "x" * 100000 + "<title>Too late</title>"
+        assert extract_html_title(html) is None
+
+
 class TestHtmlGuard:
     def test_doctype_html(self, tmp_path):
         f = tmp_path / "file.zip"
@@ -214,6 +366,11 @@ class TestHtmlGuard:
         f.write_text("<html><head></head><body></body></html>")
         assert is_probably_html_file(f)
 
+    def test_leading_whitespace_and_embedded_html(self, tmp_path):
+        f = tmp_path / "file.zip"
+        f.write_bytes(b"\r\n  <?xml version='1.0'?>\n<html><head></head><body></body></html>")
+        assert is_probably_html_file(f)
+
     def test_html_extension(self, tmp_path):
         f = tmp_path / "page.html"
         f.write_text("anything")
@@ -238,20 +395,698 @@ class TestHtmlGuard:
 
 class TestEstimateDownloadSize:
     def test_uses_yandex_estimator(self, monkeypatch):
-        import foundry_module_fetch as fetch
-
         monkeypatch.setattr(fetch, "yandex_expected_size", lambda url: 55)
         assert estimate_download_size("https://disk.yandex.ru/d/abc") == 55
 
     def test_telegram_uses_telegram_estimator(self, monkeypatch):
-        import foundry_module_fetch as fetch
-
         config = TelegramConfig(api_id=1, api_hash="hash", session="session")
         monkeypatch.setattr(fetch, "telegram_expected_size", lambda url, cfg: 123)
         assert estimate_download_size("https://t.me/c/1234567890/99", config) == 123
 
     def test_telegram_without_config_returns_none(self, monkeypatch):
-        import foundry_module_fetch as fetch
-
         monkeypatch.setattr(fetch, "telegram_expected_size", lambda url, cfg: 123)
         assert estimate_download_size("https://t.me/c/1234567890/99") is None
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, headers=None):
+        self.raw = io.BytesIO(body)
+        self.headers = headers or {}
+
+
+class TestWriteStreamToFile:
+    def test_writes_body(self, tmp_path):
+        target = tmp_path / "module.zip"
+        body = b"PK\x03\x04" + b"x" * 5000
+        response = FakeResponse(body, {"content-length": str(len(body))})
+        write_stream_to_file(response, target, "module.zip", progress=False)
+        assert target.read_bytes() == body
+        assert response.raw.decode_content is True
+
+    def test_truncates_preallocated_tail(self, tmp_path):
+        target = tmp_path / "module.zip"
+        response = FakeResponse(b"short", {"content-length": "4096"})
+        write_stream_to_file(response, target, "module.zip", progress=False)
+        assert target.read_bytes() == b"short"
+
+    def test_unknown_length(self, tmp_path):
+        target = tmp_path / "module.zip"
+        write_stream_to_file(FakeResponse(b"data"), target, "module.zip", progress=False)
+        assert target.read_bytes() == b"data"
+
+
+class DroppingRaw(io.BytesIO):
+    def __init__(self, body: bytes, drop_after: int):
+        super().__init__(body)
+        self.drop_after = drop_after
+
+    def read(self, size=-1):
+        if self.tell() >= self.drop_after:
+            raise ProtocolError("Connection broken")
+        if size < 0 or self.tell() + size > self.drop_after:
+            size = self.drop_after - self.tell()
+        return super().read(size)
+
+
+class TestResumeDownload:
+    body = bytes(range(256)) * 64
+
+    def make_response(self, raw, headers):
+        response = FakeResponse(b"", {"content-length": str(len(self.body)), **headers})
+        response.raw = raw
+        response.url = "https://dl.example.com/module.zip"
+        response.close = lambda: None
+        return response
+
+    def fake_session(self, monkeypatch, status, content_range=None):
+        requested = []
+
+        def get(url, headers=None, stream=False):
+            requested.append(headers)
+            start = int(headers["Range"].split("=")[1].rstrip("-"))
+            response = FakeResponse(self.body[start:])
+            response.status_code = status
+            response.headers = {
+                "content-range": content_range
+                or f"bytes {start}-{len(self.body) - 1}/{len(self.body)}"
+            }
+            response.close = lambda: None
+            return response
+
+        session = types.SimpleNamespace(get=get)
+        monkeypatch.setattr(fetch, "get_http_session", lambda: session)
+        return requested
+
+    @pytest.mark.skipif(ProtocolError is None, reason="urllib3 is not installed")
+    def test_resumes_after_dropped_connection(self, tmp_path, monkeypatch):
+        requested = self.fake_session(monkeypatch, 206)
+        response = self.make_response(DroppingRaw(self.body, 5000), {"etag": '"v1"'})
+        target = tmp_path / "module.zip"
+        write_stream_to_file(response, target, "module.zip", progress=False)
+        assert target.read_bytes() == self.body
+        assert requested == [{"Range": "bytes=5000-", "If-Range": '"v1"'}]
+
+    def test_resumes_short_body(self, tmp_path, monkeypatch):
+        self.fake_session(monkeypatch, 206)
+        response = self.make_response(io.BytesIO(self.body[:1000]), {})
+        target = tmp_path / "module.zip"
+        write_stream_to_file(response, target, "module.zip", progress=False)
+        assert target.read_bytes() == self.body
+
+    @pytest.mark.skipif(ProtocolError is None, reason="urllib3 is not installed")
+    def test_changed_file_is_not_spliced(self, tmp_path, monkeypatch):
+        self.fake_session(monkeypatch, 200)
+        response = self.make_response(DroppingRaw(self.body, 5000), {})
+        with pytest.raises(ProtocolError):
+            write_stream_to_file(response, tmp_path / "module.zip", "module.zip", progress=False)
+
+    def test_encoded_body_is_not_resumed(self, tmp_path, monkeypatch):
+        requested = self.fake_session(monkeypatch, 206)
+        response = self.make_response(io.BytesIO(b"short"), {"content-encoding": "gzip"})
+        write_stream_to_file(response, tmp_path / "module.zip", "module.zip", progress=False)
+        assert requested == []
+
+
+class TestHttpSession:
+    def test_shared_session_retries_idempotent_requests(self, monkeypatch):
+        pytest.importorskip("requests")
+
+        monkeypatch.setattr(fetch, "_HTTP_SESSIONS", {})
+        session = fetch.get_http_session()
+        assert fetch.get_http_session() is session
+        retry = session.get_adapter("https://example.com").max_retries
+        assert retry.total == fetch.HTTP_RETRY_TOTAL
+        assert set(retry.allowed_methods) == {"GET", "HEAD"}
+        assert retry.respect_retry_after_header
+        assert 503 in retry.status_forcelist
+
+        probe = fetch.get_http_session(retry=False)
+        assert probe is not session
+        assert probe.get_adapter("https://example.com").max_retries.total == 0
+
+    def test_retry_falls_back_for_older_urllib3(self):
+        class LegacyRetry:
+            def __init__(self, total, method_whitelist, **kwargs):
+                self.total = total
+                self.methods = method_whitelist
+
+        retry = fetch.build_retry(LegacyRetry, 3)
+        assert retry.total == 3
+        assert retry.methods == fetch.HTTP_RETRY_METHODS
+
+
+class TestInstallUrls:
+    def test_results_follow_url_order(self, monkeypatch):
+        first_started = threading.Event()
+
+        def fake_install(url, **kwargs):
+            if url == "b":
+                first_started.wait(timeout=5)
+            else:
+                first_started.set()
+            return [Path(f"/modules/{url}")]
+
+        monkeypatch.setattr(fetch, "install_url", fake_install)
+        result = fetch.install_urls(["b", "a"], 4)
+        assert result == [Path("/modules/b"), Path("/modules/a")]
+
+    def test_propagates_errors(self, monkeypatch):
+        def fake_install(url, **kwargs):
+            raise RuntimeError(f"boom {url}")
+
+        monkeypatch.setattr(fetch, "install_url", fake_install)
+        with pytest.raises(RuntimeError, match="boom"):
+            fetch.install_urls(["a"], 4)
+
+    def test_interrupt_stops_running_downloads(self, tmp_path, monkeypatch):
+        started = threading.Event()
+        stopped = []
+
+        class EndlessRaw:
+            def read(self, size=-1):
+                started.set()
+                threading.Event().wait(0.01)
+                return b"x" * 1024
+
+        def fake_install(url, **kwargs):
+            response = FakeResponse(b"")
+            response.raw = EndlessRaw()
+            try:
+                write_stream_to_file(response, tmp_path / url, url, progress=False)
+            except RuntimeError as exc:
+                stopped.append(str(exc))
+                raise
+
+        def interrupted(futures):
+            started.wait(timeout=5)
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr(fetch, "install_url", fake_install)
+        monkeypatch.setattr(fetch, "as_completed", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            fetch.install_urls(["a", "b"], 4)
+        # install_urls joined the workers, so every started download is done.
+        assert stopped and set(stopped) == {"Interrupted."}
+
+    def test_failure_waits_for_running_installs(self, monkeypatch):
+        slow_started = threading.Event()
+        finished = []
+
+        def fake_install(url, **kwargs):
+            if url == "fail":
+                slow_started.wait(timeout=5)
+                raise RuntimeError("boom")
+            slow_started.set()
+            threading.Event().wait(0.2)
+            finished.append(url)
+            return []
+
+        monkeypatch.setattr(fetch, "install_url", fake_install)
+        with pytest.raises(RuntimeError, match="boom"):
+            fetch.install_urls(["slow", "fail"], 4)
+        assert finished == ["slow"]
+
+
+class TestChown:
+    def test_resolve_numeric_owner(self):
+        assert resolve_owner("1000:1001") == (1000, 1001)
+
+    def test_resolve_user_only(self):
+        assert resolve_owner("0") == (0, -1)
+
+    def test_resolve_group_only(self):
+        assert resolve_owner(":1001") == (-1, 1001)
+
+    def test_unknown_owner(self):
+        with pytest.raises(RuntimeError, match="Unknown owner"):
+            resolve_owner("no-such-user-fmd")
+
+    def test_chown_tree_to_current_owner(self, tmp_path):
+        module = tmp_path / "module"
+        (module / "scripts").mkdir(parents=True)
+        (module / "scripts" / "main.js").write_text("x")
+        (module / "link").symlink_to(tmp_path / "missing")
+        chown_paths([module], f"{os.getuid()}:{os.getgid()}")
+        assert (module / "scripts" / "main.js").stat().st_uid == os.getuid()
+
+    def test_chown_several_roots(self, tmp_path):
+        roots = []
+        for name in ("a", "b", "c"):
+            root = tmp_path / name
+            root.mkdir()
+            (root / "module.json").write_text("{}")
+            roots.append(root)
+        chown_paths(roots + [roots[0]], f"{os.getuid()}:{os.getgid()}")
+        assert all((root / "module.json").stat().st_gid == os.getgid() for root in roots)
+
+
+class TestDetectArchive:
+    @pytest.mark.parametrize(
+        "name, kind",
+        [
+            ("module.zip", "zip"),
+            ("Module.ZIP", "zip"),
+            ("module.tar", "tar"),
+            ("module.tar.gz", "tar"),
+            ("module.v1.2.tgz", "tar"),
+            ("module.tar.xz", "tar"),
+            ("module.7z", "7z"),
+            ("module.rar", "7z"),
+            ("module.gz", None),
+            ("module.json", None),
+            ("module", None),
+        ],
+    )
+    def test_kinds(self, name, kind):
+        assert detect_archive(Path(name)) == kind
+
+
+class TestExtractArchive:
+    def test_zip(self, tmp_path):
+        archive = tmp_path / "module.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("my-module/module.json", "{}")
+        dest = tmp_path / "out"
+        extract_archive(archive, dest)
+        assert (dest / "my-module" / "module.json").read_text() == "{}"
+
+    def test_zip_many_members_in_parallel(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(fetch, "ZIP_PARALLEL_MIN_MEMBERS", 2)
+        archive = tmp_path / "module.zip"
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("my-module/", "")
+            for i in range(200):
+                zf.writestr(f"my-module/packs/{i % 7}/entry-{i}.json", f'{{"id": {i}}}' * 50)
+        dest = tmp_path / "out"
+        extract_archive(archive, dest)
+        files = list((dest / "my-module" / "packs").rglob("*.json"))
+        assert len(files) == 200
+        assert (dest / "my-module/packs/3/entry-3.json").read_text() == '{"id": 3}' * 50
+
+    def test_tar_gz(self, tmp_path):
+        source = tmp_path / "my-module"
+        source.mkdir()
+        (source / "module.json").write_text("{}")
+        archive = tmp_path / "module.tar.gz"
+        with tarfile.open(archive, "w:gz") as tf:
+            tf.add(source, arcname="my-module")
+        dest = tmp_path / "out"
+        extract_archive(archive, dest)
+        assert (dest / "my-module" / "module.json").read_text() == "{}"
+
+    def make_evil_tar(self, tmp_path, member):
+        archive = tmp_path / "module.tar"
+        with tarfile.open(archive, "w") as tf:
+            tf.addfile(member, io.BytesIO(b"pwned") if member.isfile() else None)
+        return archive
+
+    def evil_members(self):
+        escape = tarfile.TarInfo("../evil")
+        escape.size = 5
+        link = tarfile.TarInfo("my-module/link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "../../evil"
+        return [escape, link]
+
+    @pytest.mark.parametrize("with_filter", [True, False])
+    def test_tar_member_outside_destination_refused(self, tmp_path, monkeypatch, with_filter):
+        if not with_filter:
+            monkeypatch.delattr(tarfile, "data_filter", raising=False)
+        elif not hasattr(tarfile, "data_filter"):
+            pytest.skip("tarfile has no extraction filters")
+        for index, member in enumerate(self.evil_members()):
+            case = tmp_path / str(index)
+            case.mkdir()
+            archive = self.make_evil_tar(case, member)
+            with pytest.raises(RuntimeError, match="outside|unsafe"):
+                extract_archive(archive, case / "out" / "dest")
+            assert not (case / "out" / "evil").exists()
+            assert not (case / "out" / "dest" / "my-module" / "link").is_symlink()
+
+    def test_streamed_tar_member_outside_destination_refused(self, tmp_path, monkeypatch):
+        monkeypatch.delattr(tarfile, "data_filter", raising=False)
+        archive = self.make_evil_tar(tmp_path, self.evil_members()[0])
+        download_dir = tmp_path / "download"
+        download_dir.mkdir()
+        with pytest.raises(RuntimeError, match="outside"):
+            save_response(
+                FakeResponse(archive.read_bytes()),
+                download_dir,
+                "module.tar",
+                "Test",
+                "https://x",
+                progress=False,
+            )
+        assert not (download_dir / "evil").exists()
+
+    def test_empty_zip_raises(self, tmp_path):
+        archive = tmp_path / "empty.zip"
+        zipfile.ZipFile(archive, "w").close()
+        with pytest.raises(RuntimeError, match="no files"):
+            extract_archive(archive, tmp_path / "out")
+
+
+class TestLoadDotenv:
+    def test_parses_values(self, tmp_path, monkeypatch):
+        for key in ("FMD_A", "FMD_B", "FMD_C", "FMD_D", "FMD_E"):
+            monkeypatch.delenv(key, raising=False)
+        env = tmp_path / ".env"
+        env.write_text(
+            "# comment\n"
+            "FMD_A=plain\n"
+            "export FMD_B = \"quoted value\"\r\n"
+            "FMD_C='single' # trailing comment\n"
+            "FMD_D=abc#notacomment\n"
+            "FMD_E=\n"
+            "not a pair\n"
+        )
+        assert load_dotenv(env)
+        assert os.environ["FMD_A"] == "plain"
+        assert os.environ["FMD_B"] == "quoted value"
+        assert os.environ["FMD_C"] == "single"
+        assert os.environ["FMD_D"] == "abc#notacomment"
+        assert os.environ["FMD_E"] == ""
+
+    def test_respects_existing_env(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("FMD_A", "keep")
+        env = tmp_path / ".env"
+        env.write_text("FMD_A=new\n")
+        load_dotenv(env)
+        assert os.environ["FMD_A"] == "keep"
+        load_dotenv(env, override=True)
+        assert os.environ["FMD_A"] == "new"
+
+    def test_missing_file(self, tmp_path):
+        assert not load_dotenv(tmp_path / "missing.env")
+
+
+class TestDownloadCache:
+    def fake_download(self, headers):
+        def download(url, dest_dir, debug_dir, telegram, progress, record=None):
+            response = FakeResponse(b"", headers)
+            if fetch.is_unchanged_download(response, record):
+                return []
+            item = dest_dir / "module"
+            item.mkdir()
+            return [item]
+
+        return download
+
+    def install(
+        self, fetch, tmp_path, cache, url="https://www.dropbox.com/s/a/m.zip", force=False
+    ):
+        return fetch.install_url(
+            url,
+            modules_dir=tmp_path / "modules",
+            explicit_work_dir=tmp_path,
+            debug_dir=None,
+            telegram=None,
+            force=force,
+            progress=False,
+            cache=cache,
+        )
+
+    def test_records_and_skips_unchanged(self, tmp_path, monkeypatch, capsys):
+        (tmp_path / "modules").mkdir()
+        headers = {"etag": '"v1"', "content-length": "10"}
+        monkeypatch.setattr(fetch, "download_url", self.fake_download(headers))
+        cache: dict = {}
+        first = self.install(fetch, tmp_path, cache)
+        assert first == [tmp_path / "modules" / "module"]
+        assert cache["https://www.dropbox.com/s/a/m.zip"]["validator"] == ['"v1"', "10"]
+
+        entry = cache["https://www.dropbox.com/s/a/m.zip"]
+        monkeypatch.setattr(fetch, "process_downloads", lambda *args: pytest.fail("reinstalled"))
+        # Skipped modules are reported, not returned as installed (or chowned).
+        assert self.install(fetch, tmp_path, cache) == []
+        assert cache["https://www.dropbox.com/s/a/m.zip"] == entry
+        assert "Already up to date" in capsys.readouterr().err
+
+    def test_changed_etag_downloads_again(self, tmp_path, monkeypatch):
+        (tmp_path / "modules").mkdir()
+        module = tmp_path / "modules" / "module"
+        module.mkdir()
+        cache = {
+            "https://www.dropbox.com/s/a/m.zip": {"validator": ['"v0"', "10"], "paths": [str(module)]}
+        }
+        headers = {"etag": '"v1"', "content-length": "10"}
+        monkeypatch.setattr(fetch, "download_url", self.fake_download(headers))
+        self.install(fetch, tmp_path, cache)
+        assert cache["https://www.dropbox.com/s/a/m.zip"]["validator"] == ['"v1"', "10"]
+
+    def test_immutable_links_skip_without_request(self, tmp_path, monkeypatch):
+        module = tmp_path / "module"
+        module.mkdir()
+        url = "https://t.me/channel/5"
+        cache = {url: {"validator": None, "paths": [str(module)]}}
+        monkeypatch.setattr(fetch, "download_url", lambda *args: pytest.fail("downloaded"))
+        assert self.install(fetch, tmp_path, cache, url) == []
+        assert cache[url]["paths"] == [str(module)]
+
+    def test_mega_folder_link_is_checked_again(self, tmp_path, monkeypatch):
+        assert fetch.is_immutable_url("https://mega.nz/file/FILEID#KEY")
+        assert fetch.is_immutable_url("https://mega.nz/folder/FOLDERID#KEY/file/FILEID")
+        assert not fetch.is_immutable_url("https://mega.nz/folder/FOLDERID#KEY")
+
+        (tmp_path / "modules").mkdir()
+        module = tmp_path / "module"
+        module.mkdir()
+        url = "https://mega.nz/folder/FOLDERID#KEY"
+        cache = {url: {"validator": None, "paths": [str(module)]}}
+        downloads = []
+        monkeypatch.setattr(
+            fetch, "download_url", lambda *args: downloads.append(args) or []
+        )
+        self.install(fetch, tmp_path, cache, url)
+        assert len(downloads) == 1
+
+    def test_force_bypasses_cache(self, tmp_path, monkeypatch):
+        (tmp_path / "modules").mkdir()
+        module = tmp_path / "modules" / "module"
+        module.mkdir()
+        url = "https://t.me/channel/5"
+        cache = {url: {"validator": None, "paths": [str(module)]}}
+        monkeypatch.setattr(fetch, "download_url", self.fake_download({}))
+        assert self.install(fetch, tmp_path, cache, url, force=True) == [module]
+
+        headers = {"etag": '"v1"', "content-length": "10"}
+        dropbox = "https://www.dropbox.com/s/a/m.zip"
+        cache[dropbox] = {"validator": ['"v1"', "10"], "paths": [str(module)]}
+        installed = []
+        monkeypatch.setattr(fetch, "download_url", self.fake_download(headers))
+        monkeypatch.setattr(
+            fetch, "process_downloads", lambda *args: installed.append(args) or [module]
+        )
+        assert self.install(fetch, tmp_path, cache, dropbox, force=True) == [module]
+        assert len(installed) == 1
+
+    def test_roundtrip(self, tmp_path):
+        fetch.save_download_cache(tmp_path, {"u": {"validator": None, "paths": []}})
+        assert fetch.load_download_cache(tmp_path) == {"u": {"validator": None, "paths": []}}
+        assert fetch.load_download_cache(tmp_path / "missing") == {}
+
+
+class TestMoveOrMerge:
+    def test_moves_new_module(self, tmp_path):
+        src = tmp_path / "src" / "mod"
+        src.mkdir(parents=True)
+        (src / "module.json").write_text("{}")
+        modules = tmp_path / "modules"
+        modules.mkdir()
+        assert move_or_merge(src, modules, force=False) == modules / "mod"
+        assert (modules / "mod" / "module.json").read_text() == "{}"
+        assert not src.exists()
+
+    def test_merges_into_existing_module(self, tmp_path):
+        modules = tmp_path / "modules"
+        (modules / "mod" / "lang").mkdir(parents=True)
+        (modules / "mod" / "module.json").write_text("old")
+        (modules / "mod" / "lang" / "en.json").write_text("en")
+        (modules / "mod" / "keep.txt").write_text("keep")
+
+        src = tmp_path / "src" / "mod"
+        (src / "lang").mkdir(parents=True)
+        (src / "module.json").write_text("new")
+        (src / "lang" / "ru.json").write_text("ru")
+
+        move_or_merge(src, modules, force=False)
+        dest = modules / "mod"
+        assert (dest / "module.json").read_text() == "new"
+        assert (dest / "lang" / "en.json").read_text() == "en"
+        assert (dest / "lang" / "ru.json").read_text() == "ru"
+        assert (dest / "keep.txt").read_text() == "keep"
+        assert not src.exists()
+
+    def test_type_conflict_requires_force(self, tmp_path):
+        modules = tmp_path / "modules"
+        modules.mkdir()
+        (modules / "mod").write_text("file")
+        src = tmp_path / "src" / "mod"
+        src.mkdir(parents=True)
+        with pytest.raises(RuntimeError, match="--force"):
+            move_or_merge(src, modules, force=False)
+        move_or_merge(src, modules, force=True)
+        assert (modules / "mod").is_dir()
+
+    def test_missing_source_keeps_destination(self, tmp_path):
+        modules = tmp_path / "modules"
+        (modules / "mod").mkdir(parents=True)
+        (modules / "mod" / "module.json").write_text("{}")
+        with pytest.raises(RuntimeError, match="disappeared"):
+            move_or_merge(tmp_path / "src" / "mod", modules, force=True)
+        assert (modules / "mod" / "module.json").read_text() == "{}"
+
+    def test_merges_into_symlinked_dir(self, tmp_path):
+        modules = tmp_path / "modules"
+        modules.mkdir()
+        real = tmp_path / "real-mod"
+        (real / "scripts").mkdir(parents=True)
+        (modules / "mod").symlink_to(real)
+        src = tmp_path / "src" / "mod"
+        (src / "scripts").mkdir(parents=True)
+        (src / "scripts" / "main.js").write_text("new")
+        move_or_merge(src, modules, force=False)
+        assert (real / "scripts" / "main.js").read_text() == "new"
+        assert (modules / "mod").is_symlink()
+
+    def test_copy_file_keeps_content_and_mode(self, tmp_path):
+        src = tmp_path / "module.zip"
+        src.write_bytes(b"PK" * 100000)
+        src.chmod(0o640)
+        dst = tmp_path / "copy.zip"
+        assert fetch.copy_file(str(src), str(dst)) == str(dst)
+        assert dst.read_bytes() == src.read_bytes()
+        assert dst.stat().st_mode & 0o777 == 0o640
+
+    def test_copy_file_falls_back_when_nothing_is_copied(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(os, "copy_file_range", lambda *args: 0, raising=False)
+        src = tmp_path / "module.json"
+        src.write_text('{"id": "my-module"}')
+        fetch.copy_file(str(src), str(tmp_path / "copy.json"))
+        assert (tmp_path / "copy.json").read_text() == '{"id": "my-module"}'
+
+    def test_copy_file_falls_back_across_devices(self, tmp_path, monkeypatch):
+        def cross_device(*args):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        monkeypatch.setattr(os, "copy_file_range", cross_device, raising=False)
+        src = tmp_path / "module.json"
+        src.write_text("{}")
+        fetch.copy_file(str(src), str(tmp_path / "copy.json"))
+        assert (tmp_path / "copy.json").read_text() == "{}"
+
+
+class TestRequiredModules:
+    def test_http_backends_need_requests(self):
+        urls = ["https://www.dropbox.com/s/a/m.zip", "https://disk.yandex.ru/d/abc"]
+        assert fetch.required_modules(urls, False, None) == [("requests", "requests")]
+
+    def test_progress_and_telegram(self):
+        config = TelegramConfig(api_id=1, api_hash="hash", session="session")
+        required = fetch.required_modules(["https://t.me/c/1/2"], True, config)
+        assert required == [("tqdm", "tqdm"), ("telethon", "telethon")]
+
+    def test_telegram_without_config(self):
+        assert fetch.required_modules(["https://t.me/c/1/2"], False, None) == []
+
+    def test_mega_cli_available(self, monkeypatch):
+        monkeypatch.setattr(fetch, "_which", lambda name: f"/usr/bin/{name}")
+        assert fetch.required_modules(["https://mega.nz/file/a#b"], False, None) == []
+
+    def test_ensure_modules_skips_installed(self, monkeypatch):
+        monkeypatch.setattr(fetch, "run", lambda *args, **kwargs: pytest.fail("pip ran"))
+        fetch.ensure_modules([("json", "json")])
+
+
+class TestRun:
+    def test_success_and_ok_codes(self):
+        fetch.run(["true"])
+        fetch.run(["false"], ok_codes=(0, 1))
+
+    def test_failure_raises(self):
+        with pytest.raises(subprocess.CalledProcessError):
+            fetch.run(["false"])
+
+    def test_missing_tool(self):
+        with pytest.raises(FileNotFoundError):
+            fetch.run(["fmd-no-such-tool"])
+
+
+class TestStreamExtract:
+    def make_tar_gz(self, tmp_path):
+        source = tmp_path / "src" / "my-module"
+        source.mkdir(parents=True)
+        (source / "module.json").write_text("{}")
+        archive = tmp_path / "module.tar.gz"
+        with tarfile.open(archive, "w:gz") as tf:
+            tf.add(source, arcname="my-module")
+        return archive.read_bytes()
+
+    def test_tar_is_extracted_without_saving_archive(self, tmp_path):
+        download_dir = tmp_path / "download"
+        download_dir.mkdir()
+        response = FakeResponse(self.make_tar_gz(tmp_path))
+        result = save_response(
+            response, download_dir, "module.tar.gz", "Test", "https://x", progress=False
+        )
+        assert [path.name for path in result] == [".extracted"]
+        assert not (download_dir / "module.tar.gz").exists()
+
+        modules = tmp_path / "modules"
+        modules.mkdir()
+        moved = process_downloads(result, modules, force=False, work_dir=None)
+        assert moved == [modules / "my-module"]
+        assert (modules / "my-module" / "module.json").read_text() == "{}"
+
+    def test_html_instead_of_tar(self, tmp_path):
+        response = FakeResponse(b"<!DOCTYPE html><html></html>")
+        with pytest.raises(RuntimeError, match="tar archive"):
+            save_response(response, tmp_path, "module.tgz", "Test", "https://x", progress=False)
+
+    def test_zip_is_saved(self, tmp_path):
+        body = b"PK\x03\x04" + b"\x00" * 10
+        result = save_response(
+            FakeResponse(body), tmp_path, "dir/module.zip", "Test", "https://x", progress=False
+        )
+        assert result == [tmp_path / "module.zip"]
+        assert result[0].read_bytes() == body
+
+
+class TestTempDirs:
+    def test_collects_prefixed_dirs_only(self, tmp_path):
+        (tmp_path / "foundry_download_abc").mkdir()
+        (tmp_path / "foundry_extract_def").mkdir()
+        (tmp_path / "foundry_download_file").write_text("x")
+        (tmp_path / "other").mkdir()
+        found = sorted(path.name for path in fetch.collect_temp_dirs(tmp_path))
+        assert found == ["foundry_download_abc", "foundry_extract_def"]
+
+    def test_missing_base_dir(self, tmp_path):
+        assert fetch.collect_temp_dirs(tmp_path / "missing") == []
+
+    def test_work_dir_follows_modules_filesystem(self, tmp_path, monkeypatch):
+        data = tmp_path.resolve() / "data"
+        modules = data / "modules"
+        modules.mkdir(parents=True)
+        temp = tmp_path.resolve() / "tmp"
+        temp.mkdir()
+        monkeypatch.setattr(fetch.tempfile, "gettempdir", lambda: str(temp))
+        monkeypatch.setattr(fetch, "free_bytes", lambda path: fetch.MIN_TMP_FREE_BYTES)
+        assert fetch.same_filesystem_work_dir(modules) is None
+
+        devices = {str(temp): 1, str(modules): 2, str(data): 2}
+        real_stat = os.stat
+
+        def fake_stat(path, *args, **kwargs):
+            if str(path) in devices:
+                return types.SimpleNamespace(st_dev=devices[str(path)])
+            return real_stat(path, *args, **kwargs)
+
+        monkeypatch.setattr(fetch.os, "stat", fake_stat)
+        work_dir = fetch.same_filesystem_work_dir(modules)
+        assert work_dir == data / fetch.SAME_FS_WORK_DIR_NAME
+        assert work_dir.is_dir()
+
+        # modules is a mount point: its parent is on yet another device.
+        devices[str(data)] = 3
+        assert fetch.same_filesystem_work_dir(modules) is None